@@ -0,0 +1,8 @@
+# *****************************************************************************
+# Benchmarks
+#   reproducible timings for the comparison and data fusion functions.
+#   Run with ``python -m labutils.benchmarks --help``.
+# *****************************************************************************
+
+from labutils.benchmarks.data import *
+from labutils.benchmarks.run import *
@@ -0,0 +1,5 @@
+import sys
+
+from labutils.benchmarks.run import main
+
+sys.exit(main())
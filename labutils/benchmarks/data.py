@@ -0,0 +1,191 @@
+# *****************************************************************************
+# Synthetic Benchmark Data
+#   seeded generators for names, affiliations, lists and candidate pairs
+# *****************************************************************************
+
+import numpy as np
+import pandas as pd
+
+_SYLLABLES = ['an', 'ber', 'chen', 'da', 'el', 'fer', 'gar', 'ha', 'is', 'jo', 'ka', 'li', 'mar',
+              'na', 'o', 'pe', 'qui', 'ro', 'sa', 'ta', 'u', 'vi', 'wang', 'xi', 'yo', 'zhu']
+
+_PLACES = ['Waterloo', 'Toronto', 'Montreal', 'Vancouver', 'Ottawa', 'Calgary', 'Halifax', 'Guelph',
+           'Kingston', 'Victoria', 'Edmonton', 'Winnipeg', 'Regina', 'London', 'Hamilton']
+
+_FIELDS = ['Sociology', 'Computer Science', 'Statistics', 'Physics', 'Economics', 'Biology']
+
+
+def _word(rng, low, high):
+    """
+    Builds a random word from syllables.
+    """
+    return ''.join(rng.choice(_SYLLABLES, rng.randint(low, high + 1))).capitalize()
+
+
+def _typo(rng, s):
+    """
+    Returns a copy of s with one character deleted, replaced or swapped.
+    """
+    if len(s) < 2:
+        return s
+    i = rng.randint(0, len(s) - 1)
+    kind = rng.randint(0, 3)
+    if kind == 0:
+        return s[:i] + s[i + 1:]
+    elif kind == 1:
+        return s[:i] + rng.choice(list('aeiou')) + s[i + 1:]
+    else:
+        return s[:i] + s[i + 1] + s[i] + s[i + 2:]
+
+
+def _vocabulary(rng, make, size, typo_rate=.3):
+    """
+    Makes a vocabulary of distinct values and a matching vocabulary in which some
+    values carry a typo, so paired samples look like candidate pairs.
+    """
+    left = [make(rng) for _ in range(size)]
+    right = [_typo(rng, v) if rng.rand() < typo_rate else v for v in left]
+    return np.array(left, dtype=object), np.array(right, dtype=object)
+
+
+def _paired_sample(rng, left, right, n, match_rate, missing_rate=0.):
+    """
+    Draws n pairs, where a share of match_rate are (possibly misspelled)
+    matches and the rest are random non-matches. A share of missing_rate of
+    the values on each side are replaced by None or NaN.
+    """
+    i = rng.randint(0, len(left), n)
+    j = np.where(rng.rand(n) < match_rate, i, rng.randint(0, len(right), n))
+    values1, values2 = left[i], right[j]
+
+    if missing_rate > 0:
+        for values in (values1, values2):
+            missing = np.flatnonzero(rng.rand(n) < missing_rate)
+            values[missing] = np.where(rng.rand(len(missing)) < .5, None, np.nan)
+
+    return pd.Series(values1), pd.Series(values2)
+
+
+def name_pairs(n, vocabulary=5000, match_rate=.2, missing_rate=0., seed=0):
+    """
+    Generates aligned pairs of personal names. Values are drawn from a fixed
+    vocabulary, so common names repeat the way they do in real data.
+
+    :param int n: Number of pairs.
+    :param int vocabulary: Number of distinct names.
+    :param float match_rate: Share of pairs that are (possibly misspelled) matches.
+    :param float missing_rate: Share of names replaced by a missing value (None or NaN).
+    :param int seed: Random seed.
+    :return: A tuple of two pandas.Series.
+    """
+    rng = np.random.RandomState(seed)
+    left, right = _vocabulary(rng, lambda r: _word(r, 1, 3) + ' ' + _word(r, 1, 4), vocabulary)
+    return _paired_sample(rng, left, right, n, match_rate, missing_rate)
+
+
+def affiliation_pairs(n, vocabulary=2000, match_rate=.2, seed=0):
+    """
+    Generates aligned pairs of institutional affiliations such as
+    "Department of Sociology, University of Waterloo, Waterloo".
+
+    :param int n: Number of pairs.
+    :param int vocabulary: Number of distinct affiliations.
+    :param float match_rate: Share of pairs that are (possibly misspelled) matches.
+    :param int seed: Random seed.
+    :return: A tuple of two pandas.Series.
+    """
+    rng = np.random.RandomState(seed)
+
+    def make(r):
+        place = r.choice(_PLACES)
+        institution = r.choice(['University of {}', '{} Institute of Technology', '{} College']).format(
+            place if r.rand() < .5 else _word(r, 2, 3))
+        if r.rand() < .5:
+            institution = 'Department of {}, {}'.format(r.choice(_FIELDS), institution)
+        return institution + ', ' + place
+
+    left, right = _vocabulary(rng, make, vocabulary)
+    return _paired_sample(rng, left, right, n, match_rate)
+
+
+def list_pairs(n, vocabulary=20000, max_length=8, match_rate=.2, missing_rate=0., seed=0):
+    """
+    Generates aligned pairs of lists of names, e.g. co-author lists. Matching
+    pairs share some of their items.
+
+    :param int n: Number of pairs.
+    :param int vocabulary: Number of distinct list items.
+    :param int max_length: Longest list.
+    :param float match_rate: Share of pairs that overlap.
+    :param float missing_rate: Share of items replaced by a missing value (None or NaN).
+    :param int seed: Random seed.
+    :return: A tuple of two pandas.Series.
+    """
+    rng = np.random.RandomState(seed)
+    items = np.array(['{} {}'.format(_word(rng, 1, 3), _word(rng, 1, 1)[0]) for _ in range(vocabulary)], dtype=object)
+
+    lengths1 = rng.randint(1, max_length + 1, n)
+    lengths2 = rng.randint(1, max_length + 1, n)
+    flat1 = items[rng.randint(0, vocabulary, lengths1.sum())]
+    flat2 = items[rng.randint(0, vocabulary, lengths2.sum())]
+
+    # Matching pairs copy the first item from the left list.
+    offsets1 = np.cumsum(lengths1) - lengths1
+    offsets2 = np.cumsum(lengths2) - lengths2
+    matches = rng.rand(n) < match_rate
+    flat2[offsets2[matches]] = flat1[offsets1[matches]]
+
+    if missing_rate > 0:
+        for flat in (flat1, flat2):
+            missing = np.flatnonzero(rng.rand(len(flat)) < missing_rate)
+            flat[missing] = np.where(rng.rand(len(missing)) < .5, None, np.nan)
+
+    lists1 = [list(x) for x in np.split(flat1, np.cumsum(lengths1)[:-1])]
+    lists2 = [list(x) for x in np.split(flat2, np.cumsum(lengths2)[:-1])]
+    return pd.Series(lists1), pd.Series(lists2)
+
+
+class SyntheticComparison(object):
+    """
+    A stand-in for a populated recordlinkage.Compare object, holding the
+    ``df_a``, ``df_b`` and ``vectors`` attributes used by the data fusion
+    functions.
+    """
+
+    def __init__(self, df_a, df_b, vectors):
+        self.df_a = df_a
+        self.df_b = df_b
+        self.vectors = vectors
+
+
+def comparison(n, records=None, features=3, columns=5, seed=0):
+    """
+    Generates a SyntheticComparison with n candidate pairs between two tables,
+    with random comparison scores.
+
+    :param int n: Number of candidate pairs.
+    :param int records: Number of records in each table. Defaults to n // 10 (at least 10).
+    :param int features: Number of comparison score columns.
+    :param int columns: Number of data columns in each table.
+    :param int seed: Random seed.
+    :return: SyntheticComparison
+    """
+    rng = np.random.RandomState(seed)
+    records = records if records is not None else max(n // 10, 10)
+
+    def table(prefix):
+        names, _ = name_pairs(records, vocabulary=max(records // 4, 1), seed=rng.randint(2 ** 31))
+        data = {'name': names.to_numpy()}
+        for c in range(1, columns):
+            data['col{}'.format(c)] = rng.rand(records)
+        return pd.DataFrame(data, index=pd.Index(['{}{}'.format(prefix, i) for i in range(records)]))
+
+    df_a = table('a')
+    df_b = table('b')
+
+    index = pd.MultiIndex.from_arrays([df_a.index[rng.randint(0, records, n)],
+                                       df_b.index[rng.randint(0, records, n)]])
+    vectors = pd.DataFrame(rng.rand(n, features), index=index,
+                           columns=['score{}'.format(i) for i in range(features)])
+
+    return SyntheticComparison(df_a, df_b, vectors)
@@ -0,0 +1,213 @@
+# *****************************************************************************
+# Benchmark Runner
+#   times each comparison and data fusion function on synthetic data,
+#   recording peak memory, and writes JSON results that can be compared
+#   across commits.
+# *****************************************************************************
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from labutils import rl_compare, rl_fusion
+from labutils.benchmarks import data
+
+# Each benchmark is (name, dataset, function of the generated dataset).
+BENCHMARKS = [
+    ('lcss', 'names', lambda d: rl_compare.lcss(*d)),
+    ('normed_lcss', 'names', lambda d: rl_compare.normed_lcss(*d)),
+    ('fuzzy_lcss', 'names', lambda d: rl_compare.fuzzy_lcss(*d)),
+    ('normed_fuzzy_lcss', 'names', lambda d: rl_compare.normed_fuzzy_lcss(*d)),
+    ('normed_fuzzy_lcss_affiliations', 'affiliations', lambda d: rl_compare.normed_fuzzy_lcss(*d)),
+    ('compare_in', 'affiliations', lambda d: rl_compare.compare_in(*d)),
+    ('compare_except', 'affiliations',
+     lambda d: rl_compare.compare_except(*d, exceptions=['University of', 'Department of', 'Institute of'])),
+    ('compare_lists', 'lists', lambda d: rl_compare.compare_lists(*d)),
+    ('rank_pairs', 'comparison', lambda d: rl_fusion.rank_pairs(d, list(d.vectors.columns), method='sum')),
+    ('rank_pairs_top_k', 'comparison',
+     lambda d: rl_fusion.rank_pairs(d, list(d.vectors.columns), method='sum', top_k=100)),
+    ('rank_pairs_per_left_k', 'comparison',
+     lambda d: rl_fusion.rank_pairs(d, list(d.vectors.columns), method='sum', per_left_k=1)),
+    ('refine_mapping', 'comparison', lambda d: rl_fusion.refine_mapping(d)),
+    ('fast_fuse', 'comparison', lambda d: rl_fusion.fast_fuse(d)),
+    ('fuse_chunks', 'comparison', lambda d: [len(chunk) for chunk in rl_fusion.fuse_chunks(d, 100000)]),
+]
+
+# Each check is (name, dataset, function returning results that every engine must agree on).
+CHECKS = [
+    ('lcss_missing', 'names_missing',
+     lambda d: [func(*d, engine=engine) for func in (rl_compare.lcss, rl_compare.normed_lcss)
+                for engine in ('batch', 'python', 'bitparallel', 'python')]),
+    ('compare_lists_missing', 'lists_missing',
+     lambda d: [rl_compare.compare_lists(*d, metric=metric, engine=engine)
+                for metric in ('overlap', 'jaccard', 'dice') for engine in ('csr', 'python')]),
+]
+
+DATASETS = {
+    'names': data.name_pairs,
+    'names_missing': lambda n, seed: data.name_pairs(n, missing_rate=.2, seed=seed),
+    'affiliations': data.affiliation_pairs,
+    'lists': data.list_pairs,
+    'lists_missing': lambda n, seed: data.list_pairs(n, missing_rate=.2, seed=seed),
+    'comparison': data.comparison,
+}
+
+
+def _measure(func, dataset, repeat):
+    """
+    Times func(dataset), keeping the fastest of repeat runs, then runs it once
+    more under tracemalloc to record peak memory (tracing slows execution, so
+    timing runs are not traced).
+
+    :return: A tuple of (seconds, peak bytes).
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(dataset)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(dataset)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return min(seconds), peak
+
+
+def _metadata():
+    """
+    Describes the environment the benchmarks ran in.
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def run_benchmarks(sizes=(1000, 10000, 100000), only=None, repeat=3, seed=0, verbose=False):
+    """
+    Runs the benchmark suite on synthetic data of each size.
+
+    :param list sizes: Numbers of pairs to generate, e.g. 1e3 to 1e7.
+    :param list only: Optional benchmark names (or substrings of names) to run.
+    :param int repeat: Timing runs per benchmark; the fastest is kept.
+    :param int seed: Random seed for data generation.
+    :param bool verbose: Print each result as it is measured.
+    :return: A dict with "meta" and "results" entries, ready for json.dump.
+    """
+    results = []
+
+    for size in sizes:
+        size = int(size)
+        datasets = {}
+
+        for name, dataset, func in BENCHMARKS:
+            if only and not any(o in name for o in only):
+                continue
+
+            if dataset not in datasets:
+                datasets[dataset] = DATASETS[dataset](size, seed=seed)
+
+            seconds, peak = _measure(func, datasets[dataset], repeat)
+            result = {'name': name, 'size': size, 'seconds': seconds, 'peak_bytes': peak,
+                      'pairs_per_second': size / seconds if seconds > 0 else None}
+            results.append(result)
+
+            if verbose:
+                print('{:<32} {:>10} {:>12.4f}s {:>12.1f}MB'.format(name, size, seconds, peak / 2 ** 20),
+                      file=sys.stderr)
+
+    return {'meta': _metadata(), 'results': results}
+
+
+def check_engines(size=1000, seed=0):
+    """
+    Checks that the engines of each comparison function give the same scores on synthetic
+    data, including edge cases such as missing list items.
+
+    :param int size: Number of pairs to generate.
+    :param int seed: Random seed for data generation.
+    :return: list of the names of failed checks.
+    """
+    failed = []
+    for name, dataset, func in CHECKS:
+        results = func(DATASETS[dataset](int(size), seed=seed))
+        # Results come in pairs, one per engine.
+        for first, second in zip(results[::2], results[1::2]):
+            if not np.allclose(first, second, equal_nan=True):
+                failed.append(name)
+                break
+    return failed
+
+
+def compare_results(current, baseline):
+    """
+    Matches two sets of results by benchmark name and size.
+
+    :param dict current: Results from run_benchmarks.
+    :param dict baseline: Earlier results from run_benchmarks.
+    :return: pandas.DataFrame with the time and peak memory ratio (current / baseline) of each benchmark.
+    """
+    keys = ['name', 'size']
+    merged = pd.DataFrame(current['results']).merge(pd.DataFrame(baseline['results']), on=keys,
+                                                    suffixes=('', '_baseline'))
+    merged['time_ratio'] = merged['seconds'] / merged['seconds_baseline']
+    merged['memory_ratio'] = merged['peak_bytes'] / merged['peak_bytes_baseline']
+    return merged[keys + ['seconds', 'seconds_baseline', 'time_ratio', 'memory_ratio']]
+
+
+def main(argv=None):
+    """
+    Command line entry point. See ``python -m labutils.benchmarks --help``.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark labutils comparison and data fusion functions.')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e3, 1e4, 1e5],
+                        help='Numbers of pairs to benchmark (default: 1e3 1e4 1e5).')
+    parser.add_argument('--only', nargs='+', help='Only run benchmarks whose names contain these strings.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs per benchmark (default: 3).')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout.')
+    parser.add_argument('--baseline', help='Compare against JSON results from an earlier run.')
+    parser.add_argument('--check', action='store_true', help='Only check that the engines agree, then exit.')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failed = check_engines(seed=args.seed)
+        print('Engines disagree: {}'.format(', '.join(failed)) if failed else 'Engines agree.', file=sys.stderr)
+        return 1 if failed else 0
+
+    results = run_benchmarks(sizes=args.sizes, only=args.only, repeat=args.repeat, seed=args.seed, verbose=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(compare_results(results, baseline).to_string(index=False), file=sys.stderr)
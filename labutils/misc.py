@@ -1,3 +1,10 @@
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
 def new_identifier_name(base, names, sep='_'):
         """
         For finding an unused identifier name.
@@ -24,6 +31,237 @@ def new_identifier_name(base, names, sep='_'):
         return col_name
 
 
+def new_identifier_names(bases, names, sep='_'):
+    """
+    For finding many unused identifier names at once, following the rules of
+    ``new_identifier_name``. The new names are also unique among themselves.
+
+    Examples:
+
+    * bases ['sum', 'sum'] with 'sum' taken gives ['sum_1', 'sum_2'].
+    * bases ['a', 'b'] with nothing taken gives ['a', 'b'].
+
+    :param list bases: Base strings, in order of priority.
+    :param names: Names that are already taken.
+    :param str sep: Separator between a base and its numeric suffix.
+    :return: list
+    """
+    taken = set(names)
+    next_suffix = {}
+    new_names = []
+
+    for base in bases:
+        name = base
+        if name in taken:
+            # Resume the suffix search where the last search for this base stopped.
+            i = next_suffix.get(base, 1)
+            while base + sep + str(i) in taken:
+                i += 1
+            name = base + sep + str(i)
+            next_suffix[base] = i + 1
+        taken.add(name)
+        new_names.append(name)
+
+    return new_names
+
+
+def pair_positions(df, pairs, level):
+    """
+    Finds the row of df matching each pair, for one level of a pair index. Each distinct
+    label is looked up once, and expanded with the level codes.
+
+    :param pandas.DataFrame df: The data frame labelled by this level of pairs.
+    :param pandas.MultiIndex pairs: Candidate record pairs.
+    :param int level: The level of pairs to look up.
+    :return: numpy.ndarray of row positions, one per pair.
+    """
+    codes = pairs.codes[level]
+    rows = df.index.get_indexer(pairs.levels[level])
+    rows = np.where(codes == -1, -1, rows[codes] if len(rows) else codes)
+    if (rows == -1).any():
+        missing = pairs.get_level_values(level)[rows == -1].unique()
+        raise KeyError('{} pair labels not found in the index: {}'.format(len(missing), list(missing[:5])))
+    return rows
+
+
+# Process pools shared by every parallel function, keyed by worker count.
+_process_pools = {}
+
+
+def effective_n_jobs(n_jobs=None):
+    """
+    Resolves an ``n_jobs`` argument to a number of worker processes.
+    None or a negative value means one worker per CPU.
+
+    :param int n_jobs: Requested number of workers.
+    :return: int
+    """
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return max(int(n_jobs), 1)
+
+
+def get_process_pool(n_jobs=None):
+    """
+    Returns a process pool with ``n_jobs`` workers, creating it on first use.
+    Pools stay open and are reused across calls, so worker start-up is only paid once.
+    Call ``shutdown_process_pools`` to release them.
+
+    :param int n_jobs: Number of worker processes (see ``effective_n_jobs``).
+    :return: concurrent.futures.ProcessPoolExecutor
+    """
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs not in _process_pools:
+        _process_pools[n_jobs] = ProcessPoolExecutor(max_workers=n_jobs)
+    return _process_pools[n_jobs]
+
+
+def shutdown_process_pools():
+    """
+    Shuts down every process pool created by ``get_process_pool``.
+
+    :return: None
+    """
+    for pool in _process_pools.values():
+        pool.shutdown()
+    _process_pools.clear()
+
+
+class ChunkWriter(object):
+    """
+    Appends data frames to a Parquet or CSV file, one chunk at a time, so that results too
+    large for memory can be written as they are produced. Writing Parquet requires pyarrow;
+    every chunk is converted to one schema. Unless a schema is given, it is inferred from
+    the chunks. While a column is still entirely missing (so of pyarrow type null), chunks
+    are held back until a later chunk gives that column a type, but never more than
+    max_pending of them: columns still missing after that, or when the file is closed, are
+    written as null_type (string by default), and later chunks must fit it. Pass a schema
+    for sparse columns of other types.
+
+    Empty chunks are skipped unless nothing else is written, so that the file always has
+    the columns.
+
+    Example:
+        .. code:: python
+
+            with ChunkWriter('fused.parquet') as writer:
+                for chunk in fuse_chunks(comp):
+                    writer.write(chunk)
+    """
+
+    def __init__(self, path, format=None, schema=None, max_pending=4, null_type=None):
+        """
+        :param str path: The file to write. An existing file is replaced.
+        :param str format: 'parquet' or 'csv'. Defaults to 'parquet' for .parquet and .pq files, else 'csv'.
+        :param pyarrow.Schema schema: Optional Parquet schema for every chunk. Defaults to one inferred from the chunks.
+        :param int max_pending: Most Parquet chunks held back while a column is entirely missing.
+        :param pyarrow.DataType null_type: Type of columns still entirely missing. Defaults to pyarrow.string().
+        """
+        if format is None:
+            format = 'parquet' if path.lower().endswith(('.parquet', '.pq')) else 'csv'
+
+        if format == 'parquet':
+            if importlib.util.find_spec('pyarrow') is None:
+                raise ImportError('Writing Parquet files requires pyarrow (pip install pyarrow).')
+        elif format != 'csv':
+            raise ValueError('Unrecognized file format.')
+
+        self.path = path
+        self.format = format
+        self.rows = 0
+        self.schema = schema
+        self.max_pending = max_pending
+        self.null_type = null_type
+        self._parquet_writer = None
+        self._pending = []
+        self._written = False
+        self._empty = None
+
+    def _append(self, df):
+        if self.format == 'csv':
+            df.to_csv(self.path, mode='a' if self._written else 'w', header=not self._written)
+            return
+
+        import pyarrow as pa
+        if self._parquet_writer is not None or self.schema is not None:
+            self._write_tables([pa.Table.from_pandas(df, schema=self.schema)])
+            return
+
+        self._pending.append(pa.Table.from_pandas(df))
+        if (len(self._pending) >= self.max_pending
+                or not any(pa.types.is_null(field.type) for field in self._inferred_schema())):
+            self._flush()
+
+    def _inferred_schema(self):
+        """
+        The schema of the first held-back chunk, with each null-typed field taken from the
+        first later chunk in which it has a type.
+        """
+        import pyarrow as pa
+        schema = self._pending[0].schema
+        for i, field in enumerate(schema):
+            if pa.types.is_null(field.type):
+                for table in self._pending[1:]:
+                    typed = table.schema.field(field.name)
+                    if not pa.types.is_null(typed.type):
+                        schema = schema.set(i, field.with_type(typed.type))
+                        break
+        return schema
+
+    def _flush(self):
+        import pyarrow as pa
+        if self._pending:
+            self.schema = self._inferred_schema()
+            null_type = pa.string() if self.null_type is None else self.null_type
+            for i, field in enumerate(self.schema):
+                if pa.types.is_null(field.type):
+                    self.schema = self.schema.set(i, field.with_type(null_type))
+            tables, self._pending = self._pending, []
+            self._write_tables([table.select(self.schema.names).cast(self.schema) for table in tables])
+
+    def _write_tables(self, tables):
+        import pyarrow.parquet as pq
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.path, self.schema)
+        for table in tables:
+            self._parquet_writer.write_table(table)
+
+    def write(self, df):
+        """
+        Appends a data frame to the file.
+
+        :param pandas.DataFrame df: The chunk to write.
+        :return: None
+        """
+        if len(df) == 0 and not self._written:
+            self._empty = df
+            return
+        self._append(df)
+        self._written = True
+        self.rows += len(df)
+
+    def close(self):
+        """
+        Finishes the file.
+
+        :return: None
+        """
+        if not self._written and self._empty is not None:
+            self._append(self._empty)
+            self._written = True
+        if self.format == 'parquet':
+            self._flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 def hello_world():
     """
     Instantly gratifying reward for installing labutils.
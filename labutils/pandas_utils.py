@@ -1,10 +1,11 @@
 import tqdm
 import warnings
+import weakref
 import pandas as pd
 import numpy as np
-import itertools as it
 import pyperclip
 import tabulate
+from labutils.misc import ChunkWriter, effective_n_jobs, get_process_pool
 
 
 def clip_df(df, tablefmt='html'):
@@ -29,7 +30,7 @@ def clip_df(df, tablefmt='html'):
     return html
 
 
-def expand_on(df, col1, col2, rename1=None, rename2=None, drop=[], drop_collections=False):
+def expand_on(df, col1, col2, rename1=None, rename2=None, drop=[], drop_collections=False, n_jobs=1):
     """
     Returns a reshaped version of extractor's data, where unique combinations of values from col1 and col2
     are given individual rows. This method was pasted form ``tidyextractors`` on 2017-07-10.
@@ -73,22 +74,42 @@ def expand_on(df, col1, col2, rename1=None, rename2=None, drop=[], drop_collecti
     :param str rename2: The name for col2 after expansion. Defaults to col2_extended.
     :param list drop: Column names to be dropped from output.
     :param bool drop_collections: Should columns with compound values be dropped?
+    :param int n_jobs: Number of worker processes expanding blocks of rows. None or -1 uses every CPU.
     :return: pandas.DataFrame
     """
 
     # Assumption 1: Expanded columns are either atomic are built in collections
     # Assumption 2: New test_data columns added to rows from dicts in columns of collections.
 
-    # How many rows expected in the output?
-    count = len(df)
+    first_index, second_index, new_column_list = _expand_columns(df, col1, col2, rename1, rename2)
+
+    # The final expanded test_data set
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs == 1 or len(df) < 2:
+        df_out = _expand_block(df, first_index, second_index, new_column_list, progress=True)
+    else:
+        df_out = _expand_blocks(df, first_index, second_index, new_column_list, n_jobs)
+
+    # Drop unwanted columns
+    df_out = df_out.drop(columns=[col for col in drop if col in df_out.columns])
+
+    if drop_collections is True:
+        df_out = drop_collection_columns(df_out)
+
+    return df_out
 
-    # How often should the progress bar be updated?
-    update_interval = max(min(count // 100, 100), 5)
 
+def _expand_columns(df, col1, col2, rename1=None, rename2=None):
+    """
+    Finds the positions of the columns expand_on expands, in column order, and the names
+    of the expanded data frame's columns.
+
+    :return: A tuple of (first position, second position, list of new column names).
+    """
     # What are the column names?
     column_list = list(df.columns)
 
-    # Determine column index (for itertuples)
+    # Determine column index
     try:
         col1_index = column_list.index(col1)
     except ValueError:
@@ -120,131 +141,503 @@ def expand_on(df, col1, col2, rename1=None, rename2=None, drop=[], drop_collecti
         raise Exception('Duplicate columns names found. Note that you cannot rename a column with a name '
                         'that is already taken by another column.')
 
-    # List of tuples. Rows in new test_data frame.
-    old_attr_df_tuples = []
-    new_attr_df_dicts = []
-
-    # MultiIndex tuples
-    index_tuples = []
-
-    def iter_product(item1, item2):
-        """
-        Enumerates possible combinations of items from item1 and item 2. Allows atomic values.
-        :param item1: Any
-        :param item2: Any
-        :return: A list of tuples.
-        """
-        if hasattr(item1, '__iter__') and type(item1) != str:
-            iter1 = item1
-        else:
-            iter1 = [item1]
-        if hasattr(item2, '__iter__') and type(item2) != str:
-            iter2 = item2
+    return first_index, second_index, new_column_list
+
+
+def _expand_cell(item, keys, nested_positions, nested):
+    """
+    Appends the values a cell of an expanded column is expanded into to keys. Collections
+    (other than strings) are expanded into their items, and dicts into their keys; atomic
+    values are kept as they are. Dict values that are dicts themselves are appended to nested,
+    and their positions in keys to nested_positions, to become attribute columns. (Parallel
+    lists, rather than a list of tuples, keep the garbage collector out of the loop.)
+
+    :return: The number of values appended.
+    """
+    start = len(keys)
+    if hasattr(item, '__iter__') and type(item) != str:
+        if type(item) == dict:
+            keys.extend(item)
+            for offset, value in enumerate(item.values()):
+                if type(value) == dict:
+                    nested_positions.append(start + offset)
+                    nested.append(value)
         else:
-            iter2 = [item2]
-        return it.product(iter1, iter2)
+            keys.extend(item)
+    else:
+        keys.append(item)
+    return len(keys) - start
 
-    # Create test_data for output.
-    with tqdm.tqdm(total=count) as pbar:
-        for row in df.itertuples(index=False):
-            # Enumerate commit/file pairs
-            for index in iter_product(row[first_index], row[second_index]):
 
-                new_row = row[:first_index] + \
-                          (index[0],) + \
-                          row[first_index + 1:second_index] + \
-                          (index[1],) + \
-                          row[second_index + 1:]
+def _object_array(values):
+    """
+    Builds a 1-d object array, without treating sequence values as nested dimensions.
+    """
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+# Dtypes that itertuples/from_records round trips unchanged, so they can be taken directly.
+_preserved_dtypes = {np.dtype('int64'), np.dtype('float64'), np.dtype('bool'), np.dtype('datetime64[ns]')}
 
-                # Add new row to list of row tuples
-                old_attr_df_tuples.append(new_row)
 
-                # Add key tuple to list of indices
-                index_tuples.append((index[0], index[1]))
+def _expand_block(df, first_index, second_index, new_column_list, progress=False, infer_types=True):
+    """
+    Expands a block of rows for expand_on, column by column. Each cell of the expanded
+    columns is normalized once into its keys, and every other column is repeated with NumPy
+    index arithmetic, instead of building a tuple and a dict for each output row. Column
+    dtypes are inferred from the values, as DataFrame.from_records would.
+
+    :param pandas.DataFrame df: Input rows.
+    :param int first_index: Position of the first expanded column.
+    :param int second_index: Position of the second expanded column.
+    :param list new_column_list: Names of the output columns, before attribute columns.
+    :param bool progress: Show a progress bar over the input rows.
+    :param bool infer_types: Infer column dtypes. Otherwise every column is left as objects.
+    :return: pandas.DataFrame
+    """
+    count = len(df)
+    first_name = df.columns[first_index]
+    second_name = df.columns[second_index]
+
+    # Normalize the cells of the two expanded columns into flat key lists.
+    keys1, keys2, nested1, nested2, nested_positions1, nested_positions2 = [], [], [], [], [], []
+    lengths1 = np.zeros(count, dtype=np.int64)
+    lengths2 = np.zeros(count, dtype=np.int64)
+    cells = zip(df.iloc[:, first_index].tolist(), df.iloc[:, second_index].tolist())
+    with tqdm.tqdm(total=count, disable=not progress) as pbar:
+        for i, (item1, item2) in enumerate(cells):
+            lengths1[i] = _expand_cell(item1, keys1, nested_positions1, nested1)
+            lengths2[i] = _expand_cell(item2, keys2, nested_positions2, nested2)
+            pbar.update(1)
+
+    # Each row becomes the product of its keys: the first key varies slowest.
+    products = lengths1 * lengths2
+    total = int(products.sum())
+    rows = np.repeat(np.arange(count), products)
+    within = np.arange(total) - np.repeat(np.cumsum(products) - products, products)
+    row_lengths2 = lengths2[rows]
+    elements1 = (np.cumsum(lengths1) - lengths1)[rows] + within // np.maximum(row_lengths2, 1)
+    elements2 = (np.cumsum(lengths2) - lengths2)[rows] + within % np.maximum(row_lengths2, 1)
+
+    def infer(values, name):
+        if infer_types and total:
+            column = pd.Series(values, copy=False).infer_objects()
+        else:
+            column = pd.Series(values, dtype=object)
+        column.name = name
+        return column
+
+    # Columns of the original data frame, with the expanded columns replaced by their keys.
+    columns = []
+    for position, name in enumerate(new_column_list):
+        if position == first_index:
+            values = _object_array(keys1)[elements1]
+        elif position == second_index:
+            values = _object_array(keys2)[elements2]
+        else:
+            column = df.iloc[:, position]
+            if column.dtype in _preserved_dtypes and infer_types and total:
+                values = column.to_numpy()[rows]
+            else:
+                values = column.to_numpy(dtype=object)[rows]
+        columns.append(infer(values, name))
+
+    # Attribute columns, from nested dicts, in order of first appearance in the output rows.
+    # In each row the first key's attributes come first, then those of every second key,
+    # then those of the remaining first keys. Second column values win name clashes.
+    element_rows1 = np.repeat(np.arange(count), lengths1).tolist()
+    element_rows2 = np.repeat(np.arange(count), lengths2).tolist()
+    starts1 = (np.cumsum(lengths1) - lengths1).tolist()
+    starts2 = (np.cumsum(lengths2) - lengths2).tolist()
+    row_products = products.tolist()
+    first_seen = {}
+    attributes = []
+    for side, name, nested, element_rows, starts in (
+            (0, first_name, zip(nested_positions1, nested1), element_rows1, starts1),
+            (1, second_name, zip(nested_positions2, nested2), element_rows2, starts2)):
+        found = {}
+        for element, attrs in nested:
+            row = element_rows[element]
+            if row_products[row] == 0:
+                continue
+            for k, value in attrs.items():
+                entry = found.get(k)
+                if entry is None:
+                    # Nested dicts are visited in output order, so this is the first appearance on this side.
+                    attr_name = name + '/' + k
+                    entry = found[k] = (attr_name, [], [])
+                    offset = element - starts[row]
+                    group = 1 if side == 1 else (0 if offset == 0 else 2)
+                    appearance = (row, group, offset, list(attrs).index(k))
+                    if attr_name not in first_seen or appearance < first_seen[attr_name]:
+                        first_seen[attr_name] = appearance
+                entry[1].append(element)
+                entry[2].append(value)
+        found = {attr_name: (elements, values) for attr_name, elements, values in found.values()}
+        attributes.append((found, len(keys1) if side == 0 else len(keys2)))
+
+    attr_columns = []
+    for attr_name in sorted(first_seen, key=first_seen.get):
+        values = np.full(total, np.nan, dtype=object)
+        for (found, size), elements in zip(attributes, (elements1, elements2)):
+            if attr_name in found:
+                present = np.zeros(size, dtype=bool)
+                side_values = np.empty(size, dtype=object)
+                present[found[attr_name][0]] = True
+                side_values[found[attr_name][0]] = _object_array(found[attr_name][1])
+                mask = present[elements]
+                values[mask] = side_values[elements[mask]]
+        attr_columns.append(infer(values, attr_name))
+
+    df_out = pd.concat(columns + attr_columns, axis=1)
+    df_out.index = pd.RangeIndex(total)
+    return df_out
+
 
-                # If there's test_data in either of the columns add the test_data to the new attr test_data frame.
-                temp_attrs = {}
+def _expand_blocks(df, first_index, second_index, new_column_list, n_jobs):
+    """
+    Expands blocks of rows across a process pool (see labutils.get_process_pool), then joins
+    them in row order. Blocks come back untyped, and attribute columns are matched up by name
+    in order of first appearance, so the result is the same as expanding df at once.
 
-                # Get a copy of the first cell value for this index.
-                #  If it's a dict, get the appropriate entry.
+    :param pandas.DataFrame df: Input DataFrame.
+    :param int first_index: Position of the first expanded column.
+    :param int second_index: Position of the second expanded column.
+    :param list new_column_list: Names of the output columns, before attribute columns.
+    :param int n_jobs: Number of worker processes.
+    :return: pandas.DataFrame
+    """
+    # Sets are rebuilt when pickled to a worker and may iterate in another order, so pass
+    # their items as lists, in the order the serial expansion would see them.
+    df = df.copy(deep=False)
+    for position in {first_index, second_index}:
+        values = df.iloc[:, position].tolist()
+        if any(isinstance(value, (set, frozenset)) for value in values):
+            df.isetitem(position, _object_array([list(value) if isinstance(value, (set, frozenset)) else value
+                                                 for value in values]))
+
+    blocksize = -(-len(df) // (n_jobs * 4))
+    pool = get_process_pool(n_jobs)
+    futures = [pool.submit(_expand_block, df.iloc[start:start + blocksize], first_index, second_index,
+                           new_column_list, False, False)
+               for start in range(0, len(df), blocksize)]
+
+    blocks = []
+    with tqdm.tqdm(total=len(df)) as pbar:
+        for start, future in zip(range(0, len(df), blocksize), futures):
+            blocks.append(future.result())
+            pbar.update(min(blocksize, len(df) - start))
+
+    # The union of attribute columns, in order of first appearance.
+    fixed = len(new_column_list)
+    attr_names = list(dict.fromkeys(name for block in blocks for name in block.columns[fixed:]))
+    total = sum(len(block) for block in blocks)
+
+    def join(arrays, name):
+        values = np.concatenate(arrays) if arrays else np.empty(0, dtype=object)
+        column = pd.Series(values, copy=False).infer_objects() if total else pd.Series(values, dtype=object)
+        column.name = name
+        return column
+
+    columns = [join([block.iloc[:, position].to_numpy() for block in blocks], name)
+               for position, name in enumerate(new_column_list)]
+    for name in attr_names:
+        arrays = []
+        for block in blocks:
+            attrs = block.iloc[:, fixed:]
+            arrays.append(attrs[name].to_numpy() if name in attrs.columns
+                          else np.full(len(block), np.nan, dtype=object))
+        columns.append(join(arrays, name))
+
+    df_out = pd.concat(columns, axis=1)
+    df_out.index = pd.RangeIndex(total)
+    return df_out
 
-                temp_first = row[first_index]
-                if type(temp_first) == dict:
-                    temp_first = temp_first[index[0]]
-                temp_second = row[second_index]
-                if type(temp_second) == dict:
-                    temp_second = temp_second[index[1]]
 
-                # Get nested test_data for this index.
-                if type(temp_first) == dict:
-                    for k in temp_first:
-                        temp_attrs[first_name + '/' + k] = temp_first[k]
-                if type(temp_second) == dict:
-                    for k in temp_second:
-                        temp_attrs[second_name + '/' + k] = temp_second[k]
+def _attribute_names(df, first_index, second_index):
+    """
+    Lists the attribute columns expand_on would create, in order, without expanding.
 
-                # Add to the "new test_data" records.
-                new_attr_df_dicts.append(temp_attrs)
+    :param pandas.DataFrame df: Input DataFrame.
+    :param int first_index: Position of the first expanded column.
+    :param int second_index: Position of the second expanded column.
+    :return: list
+    """
+    first_name = df.columns[first_index]
+    second_name = df.columns[second_index]
+    names = {}
 
-                # Update progress bar
-                pbar.update(update_interval)
+    cells = zip(df.iloc[:, first_index].tolist(), df.iloc[:, second_index].tolist())
+    for item1, item2 in cells:
+        positions1, nested1, positions2, nested2 = [], [], [], []
+        if _expand_cell(item1, [], positions1, nested1) * _expand_cell(item2, [], positions2, nested2) == 0:
+            continue
 
-    # An expanded test_data frame with only the columns of the original test_data frame
-    df_1 = pd.DataFrame.from_records(old_attr_df_tuples, columns=new_column_list)
+        # The first key's attributes come first, then those of every second key,
+        # then those of the remaining first keys (see _expand_block).
+        first_key = [attrs for position, attrs in zip(positions1, nested1) if position == 0]
+        other_keys = [attrs for position, attrs in zip(positions1, nested1) if position != 0]
+        for name, nested in ((first_name, first_key), (second_name, nested2), (first_name, other_keys)):
+            for attrs in nested:
+                for k in attrs:
+                    names.setdefault(name + '/' + k)
 
-    # An expanded test_data frame containing any test_data held in value:key collections in the expanded cols
-    df_2 = pd.DataFrame.from_records(new_attr_df_dicts)
+    return list(names)
 
-    # The final expanded test_data set
-    df_out = pd.concat([df_1, df_2], axis=1)
 
-    # Drop unwanted columns
-    for col in drop:
-        if col in df_out.columns:
-            df_out = df_out.drop(col, 1)
+def expand_on_iter(df, col1, col2, rename1=None, rename2=None, drop=[], chunksize=10000):
+    """
+    Performs expand_on a block of input rows at a time, yielding the expanded data frame in
+    chunks, so that the expanded data (which can be many times larger than the input) is
+    never held in memory at once. Concatenating the chunks gives the rows and columns of
+    expand_on; column types are inferred for each chunk, so they can differ (e.g. int and float).
 
-    if drop_collections is True:
-        df_out = drop_collection_columns(df_out)
+    Every chunk has the same columns, in the same order: a first pass over the input finds
+    all the attribute columns, and chunks without some of them get an object column of NaN
+    (which a Parquet file types from later chunks, see ChunkWriter). The index continues
+    from one chunk to the next. Dropping collection columns depends on the whole output, so
+    it is not available here; name the columns in drop instead.
 
-    return df_out
+    :param pandas.DataFrame df: Input DataFrame.
+    :param str col1: The first column to expand on. May be an atomic value, or a dict of dict.
+    :param str col2: The second column to expand on. May be an atomic value, or a dict of dict.
+    :param str rename1: The name for col1 after expansion. Defaults to col1_extended.
+    :param str rename2: The name for col2 after expansion. Defaults to col2_extended.
+    :param list drop: Column names to be dropped from output.
+    :param int chunksize: Number of input rows expanded into each chunk.
+    :return: A generator of pandas.DataFrame
+    """
+    if chunksize < 1:
+        raise ValueError('Value of "chunksize" must be a positive integer.')
+
+    first_index, second_index, new_column_list = _expand_columns(df, col1, col2, rename1, rename2)
+    attr_names = _attribute_names(df, first_index, second_index)
+    drop = [col for col in drop if col in new_column_list or col in attr_names]
+
+    offset = 0
+    with tqdm.tqdm(total=len(df)) as pbar:
+        # An empty input still yields one (empty) chunk, so that the columns are known.
+        for start in range(0, max(len(df), 1), int(chunksize)):
+            block = df.iloc[start:start + int(chunksize)]
+            chunk = _expand_block(block, first_index, second_index, new_column_list)
+
+            # Give every chunk the same attribute columns, and a continuing index.
+            attrs = chunk.iloc[:, len(new_column_list):]
+            missing = [name for name in attr_names if name not in attrs.columns]
+            attrs = attrs.reindex(columns=attr_names)
+            attrs[missing] = attrs[missing].astype(object)
+            chunk = pd.concat([chunk.iloc[:, :len(new_column_list)], attrs], axis=1)
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+
+            pbar.update(len(block))
+            yield chunk.drop(columns=drop)
+
+
+def expand_on_to_file(df, col1, col2, path, rename1=None, rename2=None, drop=[], chunksize=10000, format=None,
+                      schema=None):
+    """
+    Writes the result of expand_on to a Parquet or CSV file, a block of input rows at a time
+    (see expand_on_iter), without holding the expanded data frame in memory. Parquet output
+    requires pyarrow, and converts every chunk to one schema (see ChunkWriter).
+
+    :param pandas.DataFrame df: Input DataFrame.
+    :param str col1: The first column to expand on. May be an atomic value, or a dict of dict.
+    :param str col2: The second column to expand on. May be an atomic value, or a dict of dict.
+    :param str path: The file to write. An existing file is replaced.
+    :param str rename1: The name for col1 after expansion. Defaults to col1_extended.
+    :param str rename2: The name for col2 after expansion. Defaults to col2_extended.
+    :param list drop: Column names to be dropped from output.
+    :param int chunksize: Number of input rows expanded into each chunk.
+    :param str format: 'parquet' or 'csv'. Defaults to 'parquet' for .parquet and .pq files, else 'csv'.
+    :param pyarrow.Schema schema: Optional Parquet schema for every chunk (see ChunkWriter).
+    :return: The number of expanded rows written.
+    """
+    with ChunkWriter(path, format, schema) as writer:
+        for chunk in expand_on_iter(df, col1, col2, rename1, rename2, drop, chunksize):
+            writer.write(chunk)
 
+    return writer.rows
 
-def drop_collection_columns(df):
+
+def drop_collection_columns(df, sample=None, cache=False):
     """
     Drops columns containing collections (i.e. sets, dicts, lists) from a DataFrame.
     This method was pasted from ``tidyextractors`` on 2017-07-10.
 
     :param pandas.DataFrame df: Input data.
+    :param int sample: Only check this many evenly spaced rows of each column (see collection_columns).
+    :param bool cache: Use and store cached collection flags (see collection_columns).
     :return: pandas.DataFrame
     """
-    all_cols = df.columns
-    keep_cols = []
-
-    # Check whether each column contains collections.
-    for c in all_cols:
-        if len(col_type_set(c, df).intersection([set, dict, list])) == 0:
-            keep_cols.append(c)
+    collections = collection_columns(df, sample, cache)
+    keep_cols = [c for c in df.columns if c not in collections]
     return df[keep_cols]
 
 
+# Types that make a column a collection column.
+_collection_types = (set, dict, list)
+
+# Collection flags of each column, by id of the data frame (see collection_columns).
+_collection_cache = {}
+
+
+def _holds_collections(values):
+    """
+    Checks an object array for sets, dicts or lists. Columns of one atomic type are recognized
+    by pandas' type inference without a Python loop; otherwise values are checked until the
+    first collection.
+
+    :param numpy.ndarray values: Object array.
+    :return: bool
+    """
+    if not pd.api.types.infer_dtype(values, skipna=True).startswith('mixed'):
+        return False
+    return any(type(value) in _collection_types for value in values)
+
+
+def _collection_flags(df):
+    """
+    Returns the cached collection flags of df's columns (see collection_columns), creating an
+    empty cache entry that is dropped when df is garbage collected.
+
+    :return: dict of column position to (token, bool)
+    """
+    entry = _collection_cache.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+
+    key = id(df)
+    flags = {}
+    _collection_cache[key] = (weakref.ref(df, lambda ref: _collection_cache.pop(key, None)), flags)
+    return flags
+
+
+def _column_token(name, values, sample=None):
+    """
+    Identifies the data a collection flag was computed from.
+    """
+    return name, values.__array_interface__['data'][0], len(values), sample
+
+
+def collection_columns(df, sample=None, cache=False):
+    """
+    Finds the columns containing collections (i.e. sets, dicts, lists), in one pass over the
+    data frame. Only object columns can hold collections, and each is checked until its first
+    collection is found.
+
+    With cache=True, results are cached for each column, keyed on the column's data buffer,
+    so repeated calls (and calls after profile_frame) are free and a replaced column is
+    checked again. Cells edited in place are not noticed, so by default every call checks
+    the data afresh.
+
+    :param pandas.DataFrame df: Input data.
+    :param int sample: Only check this many evenly spaced rows of each column. Faster on tall data frames, but may miss collections.
+    :param bool cache: Use and store cached results.
+    :return: list of column names
+    """
+    flags = _collection_flags(df) if cache is True else None
+
+    collections = []
+    for position, name in enumerate(df.columns):
+        column = df.iloc[:, position]
+        if column.dtype != np.dtype(object):
+            continue
+
+        values = column.to_numpy()
+        token = _column_token(name, values, sample)
+        exact_token = _column_token(name, values)
+        if flags is not None and flags.get(position, (None,))[0] in (token, exact_token):
+            found = flags[position][1]
+        else:
+            if sample is not None and len(values) > sample:
+                values = values[np.linspace(0, len(values) - 1, int(sample)).astype(np.int64)]
+            found = _holds_collections(values)
+            if flags is not None:
+                flags[position] = (token, found)
+
+        if found:
+            collections.append(name)
+
+    return collections
+
+
+def _type_set(values):
+    """
+    The set of types of the values in an object array, not counting NaN.
+    """
+    type_set = set(map(type, values))
+
+    # Only look for NaN if there are floats at all.
+    if any(issubclass(t, float) for t in type_set):
+        type_set = set(type(v) for v in values if not (isinstance(v, float) and v != v))
+    return type_set
+
+
+def profile_frame(df, cache=True):
+    """
+    Summarizes what each column of a data frame holds, e.g. to find the columns to expand
+    (see expand_on) or drop (see drop_collection_columns), or to pick a comparison engine
+    suited to the string lengths (see the max_len argument of lcss). Null counts are taken
+    for all columns at once; each object column is then read in a few Python passes (its
+    types, then its longest collection and string).
+
+    The summary has one row per column, with:
+        * types: the set of types of the values, not counting NaN (see col_type_set).
+        * null_count: the number of missing values.
+        * is_collection: whether the column holds sets, dicts or lists.
+        * max_collection_len: the length of the longest set, dict or list, or NaN.
+        * max_str_len: the length of the longest string, or NaN.
+
+    Collection flags are stored for collection_columns, so a later collection_columns (or
+    drop_collection_columns) with cache=True on the same data frame does not scan it again.
+
+    :param pandas.DataFrame df: Input data.
+    :param bool cache: Store collection flags for collection_columns.
+    :return: pandas.DataFrame indexed by column name.
+    """
+    flags = _collection_flags(df) if cache is True else None
+    null_counts = df.isna().sum().to_numpy()
+
+    records = []
+    for position, name in enumerate(df.columns):
+        column = df.iloc[:, position]
+        max_collection_len = np.nan
+        max_str_len = np.nan
+
+        if column.dtype == np.dtype(object):
+            values = column.to_numpy()
+            types = _type_set(values)
+            is_collection = any(t in _collection_types for t in types)
+            if is_collection:
+                max_collection_len = max(len(v) for v in values if type(v) in _collection_types)
+            if any(issubclass(t, str) for t in types):
+                max_str_len = max(len(v) for v in values if isinstance(v, str))
+            if flags is not None:
+                flags[position] = (_column_token(name, values), is_collection)
+
+        else:
+            types = {column.dtype}
+            is_collection = False
+            if pd.api.types.is_string_dtype(column.dtype) and column.count() > 0:
+                max_str_len = column.str.len().max()
+
+        records.append((types, int(null_counts[position]), is_collection, max_collection_len, max_str_len))
+
+    return pd.DataFrame(records, index=df.columns,
+                        columns=['types', 'null_count', 'is_collection', 'max_collection_len', 'max_str_len'])
+
+
 def col_type_set(col, df):
     """
-    Determines the set of types present in a DataFrame column.
+    Determines the set of types present in a DataFrame column. NaN values are not counted.
     This function was pasted from ``tidyextractors`` on 2017-07-10.
 
     :param str col: A column name.
     :param pandas.DataFrame df: Input data.
     :return: A set of Types.
     """
-    type_set = set()
     if df[col].dtype == np.dtype(object):
-        unindexed_col = list(df[col])
-        for i in range(0, len(df[col])):
-            if unindexed_col[i] == np.nan:
-                continue
-            else:
-                type_set.add(type(unindexed_col[i]))
-        return type_set
+        return _type_set(df[col].tolist())
     else:
-        type_set.add(df[col].dtype)
-        return type_set
+        return {df[col].dtype}
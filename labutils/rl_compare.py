@@ -6,6 +6,265 @@
 import pandas as pd
 import jellyfish
 import numpy as np
+import itertools
+import re
+from collections import OrderedDict
+from labutils.misc import effective_n_jobs, get_process_pool, pair_positions
+
+
+# *****************************************************************************
+# Pair Scoring
+#   shared machinery for aligning, deduplicating and caching scored pairs
+# *****************************************************************************
+def _pair_values(s1, s2):
+    """
+    A helper function that aligns two Series the same way the comparators always
+    have (see pandas.concat), returning the shared index and the values of each
+    side as object arrays.
+
+    :param (label, pandas.Series) s1: Series or DataFrame to compare all fields.
+    :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
+    :return: A tuple of (pandas.Index, numpy.ndarray, numpy.ndarray).
+    """
+    conc = pd.concat([s1, s2], axis=1, ignore_index=True)
+    return conc.index, conc[0].to_numpy(dtype=object), conc[1].to_numpy(dtype=object)
+
+
+def _is_missing(value):
+    """
+    A helper function that checks for a missing scalar value (e.g. NaN or None).
+    Collections are never considered missing.
+
+    :param value: Any
+    :return: bool
+    """
+    return pd.api.types.is_scalar(value) and bool(pd.isnull(value))
+
+
+def _rowwise(func, values1, values2):
+    """
+    A helper function that scores aligned pairs one at a time with func.
+
+    :param function func: A function taking two values and returning a score.
+    :param numpy.ndarray values1: The left values.
+    :param numpy.ndarray values2: The right values.
+    :return: numpy.ndarray of scores.
+    """
+    return np.array([func(str1, str2) for str1, str2 in zip(values1, values2)])
+
+
+def _hashable(value):
+    """
+    A helper function that makes a value usable as a dictionary key, turning
+    lists into tuples and sets into frozensets.
+
+    :param value: Any
+    :return: A hashable equivalent of value.
+    """
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class PairCache(object):
+    """
+    A bounded cache of comparison scores, keyed on the pair of compared values and
+    the comparator's scoring parameters. When full, the least recently used score
+    is evicted.
+
+    In record linkage the same pair of values (e.g. common surnames or city names)
+    is compared over and over. Pass a PairCache as the ``cache`` argument of a
+    comparison function to score each pair only once. One cache can be shared by
+    several comparators and reused across calls. Use ``hits`` and ``misses`` to
+    tune ``maxsize``.
+
+    Example:
+        .. code:: python
+
+            cache = PairCache(maxsize=100000)
+            scores = normed_fuzzy_lcss(s1, s2, cache=cache)
+            print(cache.hits, cache.misses)
+
+    Note that worker processes (e.g. in parallel_compare) each get their own copy.
+    """
+
+    def __init__(self, maxsize=2 ** 20):
+        """
+        :param int maxsize: Maximum number of scores kept.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __repr__(self):
+        return 'PairCache(maxsize={}, size={}, hits={}, misses={})'.format(
+            self.maxsize, len(self), self.hits, self.misses)
+
+    def clear(self):
+        """
+        Removes every cached score and resets the hit and miss counters.
+
+        :return: None
+        """
+        self._scores.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Looks up a score, counting a hit or a miss.
+
+        :param tuple key: The cache key.
+        :param default: Returned on a miss.
+        :return: The cached score, or default.
+        """
+        try:
+            score = self._scores[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._scores.move_to_end(key)
+        self.hits += 1
+        return score
+
+    def put(self, key, score):
+        """
+        Stores a score, evicting the least recently used scores if needed.
+
+        :param tuple key: The cache key.
+        :param score: The score to store.
+        :return: None
+        """
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+
+
+# Marks a cache miss, since None may be a legitimate score.
+_missing_score = object()
+
+
+def _factorize(values):
+    """
+    A helper function that encodes values as integer codes, like pandas.factorize.
+    Collections are made hashable first. Every missing value gets a code of its
+    own, so e.g. None and NaN are never conflated.
+
+    :param numpy.ndarray values: The values to encode.
+    :return: numpy.ndarray of integer codes.
+    """
+    try:
+        codes = pd.factorize(values)[0]
+    except TypeError:
+        hashable = np.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            hashable[i] = _hashable(value)
+        codes = pd.factorize(hashable)[0]
+
+    missing = codes == -1
+    codes[missing] = codes.max(initial=-1) + 1 + np.arange(missing.sum())
+
+    return codes
+
+
+def _factorize_pairs(values1, values2):
+    """
+    A helper function that finds the distinct pairs among aligned values.
+
+    :param numpy.ndarray values1: The left values.
+    :param numpy.ndarray values2: The right values.
+    :return: A tuple of (the row of each distinct pair's first occurrence,
+        the distinct pair number of every row).
+    """
+    codes1 = _factorize(values1)
+    codes2 = _factorize(values2)
+
+    inverse = pd.factorize(codes1 * (int(codes2.max(initial=0)) + 1) + codes2)[0]
+
+    # Codes are numbered in order of appearance, so the first row of each is easy to find.
+    first = np.empty(inverse.max(initial=-1) + 1, dtype=np.int64)
+    first[inverse[::-1]] = np.arange(len(inverse))[::-1]
+
+    return first, inverse
+
+
+def _score_pairs(values1, values2, scorer, params, cache=None):
+    """
+    A helper function that scores aligned pairs, scoring each distinct pair only
+    once and taking the scores back out to every row. If a cache is given,
+    distinct pairs are looked up in it first and only the misses are scored.
+
+    :param numpy.ndarray values1: The left values.
+    :param numpy.ndarray values2: The right values.
+    :param function scorer: Takes two aligned arrays and returns an array of scores.
+    :param tuple params: Identifies the comparator and its scoring parameters.
+    :param PairCache cache: Optional score cache.
+    :return: numpy.ndarray of scores.
+    """
+    if len(values1) == 0:
+        return scorer(values1, values2)
+
+    first, inverse = _factorize_pairs(values1, values2)
+
+    if cache is None:
+        unique_scores = scorer(values1[first], values2[first])
+        return np.asarray(unique_scores)[inverse]
+
+    keys = [(params, _hashable(values1[i]), _hashable(values2[i])) for i in first]
+
+    unique_scores = [None] * len(first)
+    missing = []
+    for j, key in enumerate(keys):
+        score = cache.get(key, _missing_score)
+        if score is _missing_score:
+            missing.append(j)
+        else:
+            unique_scores[j] = score
+
+    if len(missing) > 0:
+        rows = first[missing]
+        scores = scorer(values1[rows], values2[rows])
+        for j, score in zip(missing, scores):
+            unique_scores[j] = score
+            cache.put(keys[j], score)
+
+    return np.array(unique_scores)[inverse]
+
+
+def _apply_pairs(s1, s2, func, params, cache=None, factorize=False):
+    """
+    A helper function that applies a row-wise scoring function to aligned pairs.
+    By default this is the comparators' original DataFrame.apply. With a cache or
+    factorize=True, only distinct pairs are scored (see _score_pairs).
+
+    :param (label, pandas.Series) s1: Series or DataFrame to compare all fields.
+    :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
+    :param function func: Takes a (value1, value2) row and returns a score.
+    :param tuple params: Identifies the comparator and its scoring parameters.
+    :param PairCache cache: Optional score cache.
+    :param bool factorize: Score only distinct pairs, even without a cache.
+    :return: pandas.Series of scores.
+    """
+    if cache is None and not factorize:
+        conc = pd.concat([s1, s2], axis=1, ignore_index=True)
+        if len(conc) == 0:
+            # DataFrame.apply returns an empty DataFrame, not a Series, for no rows.
+            return pd.Series(index=conc.index, dtype=float)
+        return conc.apply(func, axis=1)
+
+    index, values1, values2 = _pair_values(s1, s2)
+
+    def scorer(values1, values2):
+        return _rowwise(lambda value1, value2: func((value1, value2)), values1, values2)
+
+    return pd.Series(_score_pairs(values1, values2, scorer, params, cache), index=index)
 
 
 # *****************************************************************************
@@ -18,7 +277,7 @@ def _longest_common_substring(s1, s2):
     https://en.wikibooks.org/wiki/Algorithm_Implementation/Strings/Longest_common_substring.
     """
 
-    if s1 is np.nan or s2 is np.nan:
+    if _is_missing(s1) or _is_missing(s2):
         return 0
 
     if min(len(s1), len(s2)) == 0:
@@ -42,36 +301,258 @@ def _longest_common_substring(s1, s2):
     return longest
 
 
-def lcss(s1, s2):
+def _bitparallel_longest_common_substring(s1, s2):
+    """
+    A helper function that computes the same value as _longest_common_substring
+    using bitvectors instead of a DP matrix.
+
+    Each character of s2 has a mask with bit i set wherever s1[i] is that
+    character. While scanning s2, runs[k] has bit i set when a common substring
+    of length k + 1 ends at s1[i] and the current character of s2, so each
+    step is a shift and an AND per run length. For strings up to 64 characters
+    every bitvector fits in a machine word, and memory is bounded by the size
+    of the alphabet plus the longest run rather than len(s1) * len(s2).
+    """
+
+    if _is_missing(s1) or _is_missing(s2):
+        return 0
+
+    if min(len(s1), len(s2)) == 0:
+        return 0
+
+    masks = {}
+    for i, char in enumerate(s1):
+        masks[char] = masks.get(char, 0) | (1 << i)
+
+    longest = 0
+    runs = []
+
+    for char in s2:
+        match = masks.get(char, 0)
+
+        # Extend every run along its diagonal. Longer runs are always a subset of
+        # shorter ones, so stop at the first run that doesn't survive.
+        next_runs = []
+        run = match
+        while run:
+            next_runs.append(run)
+            if len(next_runs) > len(runs):
+                break
+            run = (runs[len(next_runs) - 1] << 1) & match
+
+        runs = next_runs
+        if len(runs) > longest:
+            longest = len(runs)
+
+    return longest
+
+
+def _bitparallel_longest_prefix(value, check):
+    """
+    A helper function that finds the length of the longest prefix of value that
+    appears anywhere in check, using the Shift-And algorithm. Bit j of the state
+    is set when value[:j + 1] ends at the current character of check.
+
+    :param str value: The string whose prefixes are searched for.
+    :param str check: The string to search in.
+    :return: int
+    """
+    masks = {}
+    for i, char in enumerate(value):
+        masks[char] = masks.get(char, 0) | (1 << i)
+
+    full = 1 << (len(value) - 1)
+    state = 0
+    seen = 0
+
+    for char in check:
+        state = ((state << 1) | 1) & masks.get(char, 0)
+        seen |= state
+        if seen & full:
+            break
+
+    return seen.bit_length()
+
+
+def _codepoint_matrix(strings, pad):
+    """
+    A helper function that packs a list of strings into a padded 2D array of
+    unicode codepoints, one row per string.
+
+    :param list strings: The strings to pack.
+    :param int pad: The value used to fill rows past the end of each string.
+    :return: numpy.ndarray of uint32 with shape (len(strings), longest string).
+    """
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+    width = int(lengths.max()) if len(lengths) > 0 else 0
+    matrix = np.full((len(strings), width), pad, dtype=np.uint32)
+
+    # Encode everything at once, then scatter each codepoint to its row/column.
+    flat = np.frombuffer(''.join(strings).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    rows = np.repeat(np.arange(len(strings)), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix[rows, cols] = flat
+
+    return matrix
+
+
+def _lcss_batch(values1, values2, max_cells=2 ** 22):
+    """
+    A helper function that computes the longest common substring length for
+    every pair in two aligned arrays at once. The dynamic program used by
+    _longest_common_substring is run row by row over padded codepoint arrays,
+    with all pairs in a chunk advancing together, so the Python loop runs once
+    per character rather than once per cell.
+
+    Missing and empty values score 0, exactly as in _longest_common_substring.
+    Values that are not strings are scored one at a time by
+    _longest_common_substring.
+
+    :param numpy.ndarray values1: The left values.
+    :param numpy.ndarray values2: The right values.
+    :param int max_cells: Upper bound on the size of each chunk's DP row matrix.
+    :return: numpy.ndarray of integers (the length of the substring).
+    """
+    scores = np.zeros(len(values1), dtype=np.int64)
+
+    # Split pairs into those the batch engine handles and those it doesn't.
+    batch = []
+    for i, (str1, str2) in enumerate(zip(values1, values2)):
+        if isinstance(str1, str) and isinstance(str2, str):
+            if len(str1) > 0 and len(str2) > 0:
+                batch.append(i)
+        elif not (_is_missing(str1) or _is_missing(str2)):
+            scores[i] = _longest_common_substring(str1, str2)
+
+    if len(batch) == 0:
+        return scores
+
+    batch = np.array(batch)
+    lengths1 = np.fromiter((len(values1[i]) for i in batch), dtype=np.int64, count=len(batch))
+    lengths2 = np.fromiter((len(values2[i]) for i in batch), dtype=np.int64, count=len(batch))
+
+    # Group pairs of similar shape together to keep padding to a minimum.
+    batch = batch[np.lexsort((lengths2, lengths1))]
+
+    start = 0
+    while start < len(batch):
+        # Grow the chunk until its DP row matrix would exceed max_cells.
+        width = len(values2[batch[start]])
+        stop = start + 1
+        while stop < len(batch):
+            width = max(width, len(values2[batch[stop]]))
+            if (stop - start + 1) * (width + 1) > max_cells:
+                break
+            stop += 1
+
+        chunk = batch[start:stop]
+        left = _codepoint_matrix([values1[i] for i in chunk], pad=0xFFFFFFFF)
+        right = _codepoint_matrix([values2[i] for i in chunk], pad=0xFFFFFFFE)
+
+        # Only the previous row of the DP matrix is ever needed.
+        previous = np.zeros((len(chunk), right.shape[1] + 1), dtype=np.int32)
+        current = np.zeros_like(previous)
+        longest = np.zeros(len(chunk), dtype=np.int32)
+
+        for x in range(left.shape[1]):
+            matches = left[:, x, None] == right
+            np.multiply(matches, previous[:, :-1] + 1, out=current[:, 1:])
+            np.maximum(longest, current.max(axis=1), out=longest)
+            previous, current = current, previous
+
+        scores[chunk] = longest
+        start = stop
+
+    return scores
+
+
+# Above this string length, the bitparallel engine beats the batch engine.
+_auto_bitparallel_length = 800
+
+
+def _lcss_engine(engine, values1=None, values2=None, max_len=None):
+    """
+    A helper function that returns the longest common substring kernel for an
+    engine name. Every kernel takes two aligned arrays and returns an array of
+    substring lengths.
+
+    Available engines:
+        * 'batch': a NumPy DP over all pairs at once (see _lcss_batch).
+        * 'bitparallel': a bitvector scan per pair (see _bitparallel_longest_common_substring).
+        * 'python': the reference DP matrix per pair (see _longest_common_substring).
+        * 'auto': 'bitparallel' if the longest string in values1 or values2 is longer
+          than 800 characters, else 'batch'.
+
+    :param str engine: The engine name.
+    :param numpy.ndarray values1: The left values, for 'auto'.
+    :param numpy.ndarray values2: The right values, for 'auto'.
+    :param int max_len: The longest string length, for 'auto'. Found from the values if not given.
+    :return: function
+    """
+    if engine == 'auto':
+        if max_len is None:
+            longest = max((len(value) for value in itertools.chain(values1, values2) if isinstance(value, str)),
+                          default=0)
+        else:
+            # A profile gives NaN for a column without strings.
+            longest = max_len if max_len == max_len else 0
+        engine = 'bitparallel' if longest > _auto_bitparallel_length else 'batch'
+
+    if engine == 'batch':
+        return _lcss_batch
+    elif engine == 'bitparallel':
+        return lambda values1, values2: _rowwise(_bitparallel_longest_common_substring, values1, values2)
+    elif engine == 'python':
+        return lambda values1, values2: _rowwise(_longest_common_substring, values1, values2)
+    else:
+        raise ValueError('Unrecognized engine.')
+
+
+def _longest(values1, values2, engine, cache=None, factorize=False, max_len=None):
+    """
+    A helper function that computes longest common substring lengths with the
+    given engine, going through the cache if there is one. lcss and normed_lcss
+    share cached lengths.
+    """
+    kernel = _lcss_engine(engine, values1, values2, max_len)
+
+    if cache is None and not factorize:
+        return kernel(values1, values2)
+
+    return _score_pairs(values1, values2, kernel, ('lcss',), cache)
+
+
+def lcss(s1, s2, engine='batch', cache=None, factorize=False, max_len=None):
     """
     A custom comparison function to be used with the Compare.compare() method
     within recordlinkage. This is used to compare two strings, computing a
     match score based on the length of the longest common substring between
     the two strings.
 
+    By default all pairs are scored together in a single batch. The 'bitparallel'
+    engine uses less memory per pair and suits long strings or small batches.
+
     :param (label, pandas.Series) s1:  Series or DataFrame to compare all fields.
 
     :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
 
-    :return: pandas.Series of integers (the length of the substring).
-    """
-    conc = pd.concat([s1, s2], axis=1, ignore_index=True)
+    :param str engine: One of 'batch', 'bitparallel', 'python' or 'auto' (see _lcss_engine).
 
-    def lcss_apply(x):
-        """
-        Computes the longest common substring, divided by the length of the shorter string.
-        """
-        str1 = x[0]
-        str2 = x[1]
+    :param PairCache cache: Optional cache, so repeated pairs are only scored once.
 
-        longest = _longest_common_substring(str1, str2)
+    :param bool factorize: Score each distinct pair only once, then take the scores back out to every row.
 
-        return longest
+    :param int max_len: For engine='auto', the longest string length in s1 and s2, so that it is not looked for,
+        e.g. the larger max_str_len of the two columns in labutils.profile_frame.
 
-    return conc.apply(lcss_apply, axis=1)
+    :return: pandas.Series of integers (the length of the substring).
+    """
+    index, values1, values2 = _pair_values(s1, s2)
+
+    return pd.Series(_longest(values1, values2, engine, cache, factorize, max_len), index=index)
 
 
-def normed_lcss(s1, s2):
+def normed_lcss(s1, s2, engine='batch', cache=None, factorize=False, max_len=None):
     """
     A custom comparison function to be used with the Compare.compare() method
     within recordlinkage. This is used to compare two strings, computing a
@@ -80,41 +561,55 @@ def normed_lcss(s1, s2):
 
     The score resulting from the comparison can be expressed as the length of
     the longest common substring, divided by the length of the shorter string.
-    The resulting score is equal or between 0 and 1.
+    The resulting score is equal or between 0 and 1. Pairs with a missing or
+    empty string score 0.
+
+    By default all pairs are scored together in a single batch. The 'bitparallel'
+    engine uses less memory per pair and suits long strings or small batches.
 
     :param (label, pandas.Series) s1:  Series or DataFrame to compare all fields.
 
     :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
 
-    :return: pandas.Series with similarity values equal or between 0 and 1.
-    """
-    conc = pd.concat([s1, s2], axis=1, ignore_index=True)
+    :param str engine: One of 'batch', 'bitparallel', 'python' or 'auto' (see _lcss_engine).
 
-    def normed_lcss_apply(x):
-        """
-        Computes the longest common substring, divided by the length of the shorter string.
-        """
-        str1 = x[0]
-        str2 = x[1]
+    :param PairCache cache: Optional cache, so repeated pairs are only scored once.
 
-        if min(len(str1), len(str2)) == 0:
-            return 0
+    :param bool factorize: Score each distinct pair only once, then take the scores back out to every row.
+
+    :param int max_len: For engine='auto', the longest string length in s1 and s2, so that it is not looked for,
+        e.g. the larger max_str_len of the two columns in labutils.profile_frame.
+
+    :return: pandas.Series with similarity values equal or between 0 and 1.
+    """
+    index, values1, values2 = _pair_values(s1, s2)
 
-        longest = _longest_common_substring(str1,str2)
+    longest = _longest(values1, values2, engine, cache, factorize, max_len)
 
-        return longest / min(len(str1), len(str2))
+    # Normalize by the length of the shorter string.
+    shorter = np.array([0 if _is_missing(str1) or _is_missing(str2)
+                        else min(len(str1), len(str2))
+                        for str1, str2 in zip(values1, values2)], dtype=np.float64)
+    scores = np.divide(longest, shorter, out=np.zeros(len(longest)), where=shorter > 0)
 
-    return conc.apply(normed_lcss_apply, axis=1)
+    return pd.Series(scores, index=index)
 
 
-def _fuzzy_longest_common_substring(str1, str2, match, mismatch, gap):
+def _fuzzy_longest_common_substring(str1, str2, match, mismatch, gap, threshold=None):
     """
+    Only two rows of the DP matrix are kept, each as long as the shorter string.
+
+    If a threshold is given, scoring stops as soon as no remaining cell can reach
+    it, and the highest score seen so far is returned. Scores that reach the
+    threshold are always exact; scores below it may be a lower bound. The cutoff
+    is ignored unless match >= 0, mismatch <= match and gap <= 0.
 
     :param str str1: The first string to be compared.
     :param str str2: The second string to be compared.
     :param float match: Value added to score for matching characters.
     :param float mismatch: Value added to score for mismatching characters.
     :param float gap: Value added to score for gaps between similar characters.
+    :param float threshold: Optional score below which exact scoring is abandoned.
     :return: A numeric similarity score.
     """
 
@@ -124,33 +619,59 @@ def _fuzzy_longest_common_substring(str1, str2, match, mismatch, gap):
     if min(len(str1), len(str2)) == 0:
         return 0
 
-    m = [[0] * (1 + len(str2)) for i in range(1 + len(str1))]
+    # The matrix for swapped strings is the transpose, so the highest score is the same.
+    if len(str2) > len(str1):
+        str1, str2 = str2, str1
+
+    # The cutoff assumes no step can score more than a match.
+    if match < 0 or mismatch > match or gap > 0:
+        threshold = None
+
+    previous = [0] * (1 + len(str2))
+    row_highest = 0
 
     highest = 0
 
     for x in range(1, 1 + len(str1)):
+
+        # Any path from the previous row gains at most "match" per remaining diagonal step.
+        if threshold is not None and highest < threshold:
+            remaining = min(len(str1) - x + 1, len(str2))
+            if row_highest + match * remaining < threshold:
+                break
+
+        current = [0] * (1 + len(str2))
+        row_highest = 0
+
         for y in range(1, 1 + len(str2)):
             if str1[x - 1] == str2[y - 1]:
-                diagonal = m[x - 1][y - 1] + match
+                diagonal = previous[y - 1] + match
             else:
-                diagonal = m[x - 1][y - 1] + mismatch
-            gap_left = m[x - 1][y] + gap
-            gap_above = m[x][y - 1] + gap
+                diagonal = previous[y - 1] + mismatch
+            gap_left = previous[y] + gap
+            gap_above = current[y - 1] + gap
 
-            m[x][y] = max(diagonal, gap_left, gap_above)
+            score = max(diagonal, gap_left, gap_above)
 
             # If negative, boost to 0
-            if m[x][y] < 0:
-                m[x][y] = 0
+            if score < 0:
+                score = 0
+
+            current[y] = score
 
             # Update Highest
-            if m[x][y] > highest:
-                highest = m[x][y]
+            if score > row_highest:
+                row_highest = score
+
+        if row_highest > highest:
+            highest = row_highest
+
+        previous = current
 
     return highest
 
 
-def normed_fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1):
+def normed_fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1, threshold=None, cache=None, factorize=False):
     """
     A custom comparison function to be used with the Compare.compare() method
     within recordlinkage. This is used to compare two strings, computing a
@@ -168,16 +689,21 @@ def normed_fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1):
     score by the maximum possible score (i.e. the length of the shorter string
     multiplied by the "match" parameter).
 
+    If a threshold is given, pairs that cannot reach it stop being scored early.
+    Their values are lower bounds that are still below the threshold, while
+    values at or above it are exact.
+
     :param (label, pandas.Series) s1: Series or DataFrame to compare all fields.
     :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
     :param float match: Value added to score for matching characters.
     :param float mismatch: Value added to score for mismatching characters.
     :param float gap: Value added to score for gaps between similar characters.
+    :param float threshold: Optional normalized score (between 0 and 1) of interest.
+    :param PairCache cache: Optional cache, so repeated pairs are only scored once.
+    :param bool factorize: Score each distinct pair only once, then take the scores back out to every row.
     :return: pandas.Series with similarity values equal or between 0 and 1.
     """
 
-    conc = pd.concat([s1, s2], axis=1, ignore_index=True)
-
     def normed_fuzzy_lcss_apply(x):
         """
         An internal function for computing the match score between two strings.
@@ -204,14 +730,19 @@ def normed_fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1):
         nonlocal mismatch
         nonlocal gap
 
-        highest = _fuzzy_longest_common_substring(str1, str2, match, mismatch, gap)
+        # Scale the threshold up to the raw score for this pair.
+        raw_threshold = None
+        if threshold is not None:
+            raw_threshold = threshold * min(len(str1), len(str2)) * match
+
+        highest = _fuzzy_longest_common_substring(str1, str2, match, mismatch, gap, raw_threshold)
 
         return highest / (min(len(str1), len(str2)) * match)
 
-    return conc.apply(normed_fuzzy_lcss_apply, axis=1)
+    return _apply_pairs(s1, s2, normed_fuzzy_lcss_apply, ('normed_fuzzy_lcss', match, mismatch, gap, threshold), cache, factorize)
 
 
-def fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1):
+def fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1, threshold=None, cache=None, factorize=False):
     """
     A custom comparison function to be used with the Compare.compare() method
     within recordlinkage. This is used to compare two strings, computing a
@@ -227,16 +758,21 @@ def fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1):
 
     In this method, the raw numeric score is produced.
 
+    If a threshold is given, pairs that cannot reach it stop being scored early.
+    Their values are lower bounds that are still below the threshold, while
+    values at or above it are exact.
+
     :param (label, pandas.Series) s1: Series or DataFrame to compare all fields.
     :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
     :param float match: Value added to score for matching characters.
     :param float mismatch: Value added to score for mismatching characters.
     :param float gap: Value added to score for gaps between similar characters.
+    :param float threshold: Optional raw score of interest.
+    :param PairCache cache: Optional cache, so repeated pairs are only scored once.
+    :param bool factorize: Score each distinct pair only once, then take the scores back out to every row.
     :return: pandas.Series with numeric similarity values.
     """
 
-    conc = pd.concat([s1, s2], axis=1, ignore_index=True)
-
     def fuzzy_lcss_apply(x):
         """
         An internal function for computing the match score between two strings.
@@ -260,17 +796,89 @@ def fuzzy_lcss(s1, s2, match=1, mismatch=-.5, gap=-1):
         nonlocal mismatch
         nonlocal gap
 
-        highest = _fuzzy_longest_common_substring(str1, str2, match, mismatch, gap)
+        highest = _fuzzy_longest_common_substring(str1, str2, match, mismatch, gap, threshold)
 
         return highest
 
-    return conc.apply(fuzzy_lcss_apply, axis=1)
+    return _apply_pairs(s1, s2, fuzzy_lcss_apply, ('fuzzy_lcss', match, mismatch, gap, threshold), cache, factorize)
 
 
 # *****************************************************************************
 # Collection Comparators
 # *****************************************************************************
-def compare_lists(s1, s2):
+def _set_overlap_batch(values1, values2, metric='overlap'):
+    """
+    A helper function that scores every pair of collections at once. Each side
+    is flattened into a CSR-style pair of arrays (offsets and items), and every
+    item is encoded once as an integer token ID shared by both sides. Set sizes
+    and intersection sizes for all pairs then come from hashed (pair, token)
+    keys, without building any Python sets.
+
+    Pairs with a missing value score NaN, as do pairs whose denominator is 0
+    (e.g. an empty list under 'overlap').
+
+    :param numpy.ndarray values1: The left collections.
+    :param numpy.ndarray values2: The right collections.
+    :param str metric: One of 'overlap', 'jaccard' or 'dice' (see compare_lists).
+    :return: numpy.ndarray of floats.
+    """
+    scores = np.full(len(values1), np.nan)
+
+    rows = np.array([i for i, (list1, list2) in enumerate(zip(values1, values2))
+                     if not (_is_missing(list1) or _is_missing(list2))], dtype=np.int64)
+    if len(rows) == 0:
+        return scores
+
+    # Flatten each side into CSR form: offsets into one flat array of items.
+    lists1 = values1[rows]
+    lists2 = values2[rows]
+    offsets1 = np.concatenate([[0], np.cumsum([len(x) for x in lists1])]).astype(np.int64)
+    offsets2 = np.concatenate([[0], np.cumsum([len(x) for x in lists2])]).astype(np.int64)
+
+    # Encode items from both sides with one shared vocabulary.
+    items = np.fromiter(itertools.chain(itertools.chain.from_iterable(lists1),
+                                        itertools.chain.from_iterable(lists2)),
+                        dtype=object, count=offsets1[-1] + offsets2[-1])
+    tokens = pd.factorize(items)[0]
+
+    # Missing items are still set members. set() tells None and NaN objects
+    # apart by identity (NaN never equals itself), so tokenize them by id.
+    missing = tokens == -1
+    if missing.any():
+        ids = np.fromiter(map(id, items[missing]), dtype=np.uint64, count=int(missing.sum()))
+        tokens[missing] = tokens.max() + 1 + pd.factorize(ids)[0]
+    vocabulary = int(tokens.max(initial=0)) + 1
+
+    # Reduce each collection to its distinct items, as (pair, token) keys.
+    pairs1 = np.repeat(np.arange(len(rows)), np.diff(offsets1))
+    pairs2 = np.repeat(np.arange(len(rows)), np.diff(offsets2))
+    keys1 = pd.unique(pairs1 * vocabulary + tokens[:offsets1[-1]])
+    keys2 = pd.unique(pairs2 * vocabulary + tokens[offsets1[-1]:])
+    lengths1 = np.bincount(keys1 // vocabulary, minlength=len(rows))
+    lengths2 = np.bincount(keys2 // vocabulary, minlength=len(rows))
+
+    # A left key is shared exactly when the same item is in the right collection.
+    shared = pd.Index(keys1).isin(keys2)
+    intersect = np.bincount(keys1[shared] // vocabulary, minlength=len(rows)).astype(np.float64)
+
+    if metric == 'overlap':
+        numerator = intersect
+        denominator = np.minimum(lengths1, lengths2)
+    elif metric == 'jaccard':
+        numerator = intersect
+        denominator = lengths1 + lengths2 - intersect
+    elif metric == 'dice':
+        numerator = 2 * intersect
+        denominator = lengths1 + lengths2
+    else:
+        raise ValueError('Unrecognized metric.')
+
+    scores[rows] = np.divide(numerator, denominator, out=np.full(len(rows), np.nan), where=denominator > 0)
+
+    return scores
+
+
+def compare_lists(s1, s2, metric='overlap', engine='csr', cache=None, factorize=False):
     """
     A custom comparison function to be used with the Compare.compare() method
     within recordlinkage. This is used to compare two lists, computing a
@@ -280,14 +888,45 @@ def compare_lists(s1, s2):
     shared items between two sets, divided by the total number of unique items
     in the smaller set.
 
+    Available metrics:
+        * 'overlap': shared items divided by the size of the smaller set (default).
+        * 'jaccard': shared items divided by the size of the union.
+        * 'dice': twice the shared items divided by the sum of both sizes.
+
+    By default all pairs are scored together in a single batch (see
+    _set_overlap_batch), where pairs with an empty set and a zero denominator
+    score NaN. The 'python' engine scores pairs one at a time.
+
     :param (label, pandas.Series) s1:  Series or DataFrame to compare all fields.
 
     :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
 
+    :param str metric: One of 'overlap', 'jaccard' or 'dice'.
+
+    :param str engine: 'csr' or 'python'.
+
+    :param PairCache cache: Optional cache, so repeated pairs are only scored once.
+
+    :param bool factorize: Score each distinct pair only once, then take the scores back out to every row.
+
     :return: pandas.Series with similarity values equal or between 0 and 1.
     """
+    if metric not in ('overlap', 'jaccard', 'dice'):
+        raise ValueError('Unrecognized metric.')
 
-    conc = pd.concat([s1, s2], axis=1, ignore_index=True)
+    if engine == 'csr':
+        index, values1, values2 = _pair_values(s1, s2)
+
+        def scorer(values1, values2):
+            return _set_overlap_batch(values1, values2, metric)
+
+        if cache is not None or factorize:
+            return pd.Series(_score_pairs(values1, values2, scorer, ('compare_lists', metric), cache), index=index)
+
+        return pd.Series(scorer(values1, values2), index=index)
+
+    elif engine != 'python':
+        raise ValueError('Unrecognized engine.')
 
     def list_apply(x):
         """
@@ -307,9 +946,15 @@ def compare_lists(s1, s2):
             set1 = set(x[0])
             set2 = set(x[1])
 
-            min_length = min(len(set1), len(set2))
             intersect_length = len(set1.intersection(set2))
 
+            if metric == 'jaccard':
+                return intersect_length / len(set1.union(set2))
+            elif metric == 'dice':
+                return 2 * intersect_length / (len(set1) + len(set2))
+
+            min_length = min(len(set1), len(set2))
+
             return intersect_length / min_length
 
         except Exception as err:
@@ -318,75 +963,413 @@ def compare_lists(s1, s2):
             else:
                 raise err
 
-    return conc.apply(list_apply, axis=1)
+    return _apply_pairs(s1, s2, list_apply, ('compare_lists', metric), cache, factorize)
 
 
-# Need to decide whether to actually include this or not
-def compare_in(s1, s2):
-    # TODO: Determine whether this is a needed. compare_longest_substring and normed_fuzzy_lcss might do the job
+def _suffix_automaton(text):
     """
+    A helper function that builds the suffix automaton of text. Every substring
+    of text is spelled by a path of transitions from state 0, so a string can be
+    checked for containment one character at a time.
 
-    :param (pandas.Series) s1:
-    :param (pandas.Series) s2:
-    :return:
+    :param str text: The string to index.
+    :return: A list of transition dicts, one per state.
     """
-    concatenated = pd.concat([s1, s2], axis=1, ignore_index=True)
+    transitions = [{}]
+    link = [-1]
+    length = [0]
+    last = 0
+
+    for char in text:
+        current = len(length)
+        transitions.append({})
+        length.append(length[last] + 1)
+        link.append(0)
+
+        state = last
+        while state != -1 and char not in transitions[state]:
+            transitions[state][char] = current
+            state = link[state]
+
+        if state != -1:
+            target = transitions[state][char]
+            if length[state] + 1 == length[target]:
+                link[current] = target
+            else:
+                # Split the target state so lengths stay consistent.
+                clone = len(length)
+                transitions.append(dict(transitions[target]))
+                length.append(length[state] + 1)
+                link.append(link[target])
+                while state != -1 and transitions[state].get(char) == target:
+                    transitions[state][char] = clone
+                    state = link[state]
+                link[target] = clone
+                link[current] = clone
 
-    def in_apply(x):
-        # TODO: Implement functionality for user to specify whether searching colA in colB or colB in colA
-        """
-        Internal function that compares values from the two series,
-         determining whether the value from s1 (x[0]) is contained within
-         the value from s2 x[1].
+        last = current
+
+    return transitions
 
-        If x[0] is contained within x[1] a score of 1 is returned.
-        If no subset of x[0] is contained within
-        """
-        try:
-            value = x[0]
-            max_length = len(value)
-            check = x[1]
-
-            def score(val, chk, count=0):
-                if value == '':
-                    return 0
-                elif value in check:
-                    return 1 - count / max_length
-                else:
-                    return score(value[0:-1], check, count + 1)
-
-            return score(value, check)
-        except Exception as err:
-            if pd.isnull(x[0]) or pd.isnull(x[1]):
-                return np.nan
-            else:
-                raise err
 
-    return concatenated.apply(in_apply, axis=1)
+def _automaton_longest_prefix(transitions, value):
+    """
+    A helper function that finds the length of the longest prefix of value that
+    appears in the text indexed by a suffix automaton.
+
+    :param list transitions: A suffix automaton (see _suffix_automaton).
+    :param str value: The string whose prefixes are searched for.
+    :return: int
+    """
+    state = 0
+    longest = 0
+    for char in value:
+        state = transitions[state].get(char)
+        if state is None:
+            break
+        longest += 1
+    return longest
+
+
+def _trimmed_longest_prefix(value, check):
+    """
+    A helper function that finds the length of the longest prefix of value that
+    appears in check, by trimming value one character at a time.
+
+    :param str value: The string whose prefixes are searched for.
+    :param str check: The string to search in.
+    :return: int
+    """
+    for longest in range(len(value), 0, -1):
+        if value[:longest] in check:
+            return longest
+    return 0
+
+
+def _in_score(value, check, longest_prefix):
+    """
+    A helper function that scores how much of value is contained in check: 1 if
+    all of it is, otherwise 1 minus the share of characters that have to be
+    trimmed from the end of value before the rest is found in check.
+
+    :param str value: The string searched for.
+    :param str check: The string searched in.
+    :param function longest_prefix: Takes value and check, returns a prefix length.
+    :return: A float between 0 and 1, 0 if value is empty, or NaN if either is missing.
+    """
+    if _is_missing(value):
+        return np.nan
+
+    max_length = len(value)
+    if max_length == 0:
+        return 0
+
+    if _is_missing(check):
+        return np.nan
+
+    return 1 - (max_length - longest_prefix(value, check)) / max_length
+
+
+def _in_batch(values, checks, engine='automaton'):
+    """
+    A helper function that scores aligned values against aligned checks (see
+    _in_score). The 'automaton' engine groups pairs by check and indexes each
+    distinct check once, so a repeated right-hand value is only indexed once.
+
+    :param numpy.ndarray values: The strings searched for.
+    :param numpy.ndarray checks: The strings searched in.
+    :param str engine: One of 'automaton', 'bitparallel' or 'python'.
+    :return: numpy.ndarray of floats.
+    """
+    if engine == 'bitparallel':
+        return _rowwise(lambda value, check: _in_score(value, check, _bitparallel_longest_prefix), values, checks)
+    elif engine == 'python':
+        return _rowwise(lambda value, check: _in_score(value, check, _trimmed_longest_prefix), values, checks)
+    elif engine != 'automaton':
+        raise ValueError('Unrecognized engine.')
+
+    scores = np.empty(len(values))
+
+    transitions = None
+
+    def longest_prefix(value, check):
+        return _automaton_longest_prefix(transitions, value)
+
+    codes = _factorize(checks)
+    current = None
+    for i in np.argsort(codes, kind='stable'):
+        if codes[i] != current:
+            current = codes[i]
+            transitions = None if _is_missing(checks[i]) else _suffix_automaton(checks[i])
+        scores[i] = _in_score(values[i], checks[i], longest_prefix)
+
+    return scores
+
+
+def compare_in(s1, s2, direction='left', engine='automaton', factorize=False):
+    """
+    A custom comparison function to be used with the Compare.compare() method
+    within recordlinkage. This is used to check whether one string is contained
+    within another.
+
+    If the searched value is contained within the other value, a score of 1 is
+    returned. Otherwise characters are trimmed from the end of the searched value
+    until the rest is found, and the score is 1 minus the share of characters
+    trimmed. An empty searched value scores 0, and missing values score NaN.
+
+    Available engines:
+        * 'automaton': index each distinct searched-in value once, then match
+          prefixes in a single pass (default).
+        * 'bitparallel': find the longest prefix with a single Shift-And scan.
+        * 'python': trim and search with ``in``.
+
+    :param (label, pandas.Series) s1: Series or DataFrame to compare all fields.
+    :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
+    :param str direction: 'left' to search for s1 values in s2 values, or 'right' to search for s2 values in s1 values.
+    :param str engine: One of 'automaton', 'bitparallel' or 'python'.
+    :param bool factorize: Score each distinct pair only once, then take the scores back out to every row.
+    :return: pandas.Series with similarity values equal or between 0 and 1.
+    """
+    if direction == 'left':
+        index, values, checks = _pair_values(s1, s2)
+    elif direction == 'right':
+        index, checks, values = _pair_values(s1, s2)
+    else:
+        raise ValueError('Unrecognized direction.')
+
+    if engine not in ('automaton', 'bitparallel', 'python'):
+        raise ValueError('Unrecognized engine.')
+
+    def scorer(values, checks):
+        return _in_batch(values, checks, engine)
+
+    if factorize:
+        return pd.Series(_score_pairs(values, checks, scorer, ('compare_in',)), index=index)
+
+    return pd.Series(scorer(values, checks), index=index)
 
 
 # *****************************************************************************
 # Misc Comparators
 # *****************************************************************************
 
-# This one is not working properly
-def compare_except(s1, s2, exceptions=[]):
+def _exception_pattern(exceptions):
+    """
+    A helper function that compiles a list of exception strings into a single
+    regular expression. Longer exceptions are tried first, so an exception that
+    contains another is removed whole.
+
+    :param list exceptions: Strings to be matched literally.
+    :return: A compiled regular expression, or None if there is nothing to match.
+    """
+    exceptions = sorted(set(ex for ex in exceptions if len(ex) > 0), key=len, reverse=True)
+    if len(exceptions) == 0:
+        return None
+    return re.compile('|'.join(re.escape(ex) for ex in exceptions))
+
+
+def compare_except(s1, s2, exceptions=[], strip='both', method='jaro', cache=None, factorize=True):
+    """
+    A custom comparison function to be used with the Compare.compare() method
+    within recordlinkage. This is used to compare two strings after removing
+    uninformative substrings (e.g. "University of" or "Inc."), computing a match
+    score based on the Jaro or Jaro-Winkler similarity of what is left.
+
+    All exceptions are removed in a single pass over each column. Where
+    exceptions overlap, the longest one is removed. Missing values score NaN.
+
+    :param (label, pandas.Series) s1: Series or DataFrame to compare all fields.
+    :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
+    :param list exceptions: Strings to remove before comparing.
+    :param str strip: Remove exceptions from the 'left', 'right' or 'both' (default) values.
+    :param str method: 'jaro' or 'jarowinkler'.
+    :param PairCache cache: Optional cache, so repeated pairs are only scored once.
+    :param bool factorize: Score each distinct cleaned pair only once, then take the scores back out to every row.
+    :return: pandas.Series with similarity values equal or between 0 and 1.
+    """
+    if strip not in ('left', 'right', 'both'):
+        raise ValueError('Unrecognized strip option.')
+
+    if method == 'jaro':
+        similarity = jellyfish.jaro_similarity
+    elif method == 'jarowinkler':
+        similarity = jellyfish.jaro_winkler_similarity
+    else:
+        raise ValueError('Unrecognized method.')
+
     conc = pd.concat([s1, s2], axis=1, ignore_index=True)
 
-    def except_apply(x):
-        try:
-            str1 = x[0]
-            str2 = x[1]
+    # Strip exceptions column-wise.
+    pattern = _exception_pattern(exceptions)
+    sides = [conc[0], conc[1]]
+    for i, side in enumerate(sides):
+        if pattern is None or strip not in ('both', ('left', 'right')[i]):
+            continue
+        if pd.api.types.is_object_dtype(side) or pd.api.types.is_string_dtype(side):
+            sides[i] = side.str.replace(pattern, '', regex=True)
 
-            for ex in exceptions:
-                str1 = str1.replace(ex, "")
+    def except_apply(str1, str2):
+        if _is_missing(str1) or _is_missing(str2):
+            return np.nan
+        return similarity(str1, str2)
 
-            return jellyfish.jaro_distance(str1, str2)
+    def scorer(values1, values2):
+        return _rowwise(except_apply, values1, values2)
 
-        except Exception as err:
-            if pd.isnull(x[0]) or pd.isnull(x[1]):
-                return np.nan
-            else:
-                raise err
+    values1 = sides[0].to_numpy(dtype=object)
+    values2 = sides[1].to_numpy(dtype=object)
+
+    # Cleaned values are cached, so the exceptions aren't part of the key.
+    if cache is not None or factorize:
+        return pd.Series(_score_pairs(values1, values2, scorer, ('compare_except', method), cache), index=conc.index)
+
+    return pd.Series(scorer(values1, values2), index=conc.index)
+
+
+# *****************************************************************************
+# Parallel Execution
+# *****************************************************************************
+def parallel_compare(func, s1, s2, n_jobs=None, chunksize=None, **kwargs):
+    """
+    Runs any comparison function from this module across a pool of worker
+    processes. The aligned pairs are split into chunks, each chunk is scored by
+    func in a worker, and the results are stitched back together in the original
+    order. Extra keyword arguments (e.g. match, mismatch, gap or exceptions) are
+    passed on to func.
+
+    The pool is shared across calls (see labutils.get_process_pool). To use this
+    with recordlinkage, bind the comparator first, e.g.
+    ``functools.partial(parallel_compare, normed_fuzzy_lcss)``.
+
+    :param function func: A comparison function taking two Series.
+    :param (label, pandas.Series) s1: Series or DataFrame to compare all fields.
+    :param (label, pandas.Series) s2: Series or DataFrame to compare all fields.
+    :param int n_jobs: Number of worker processes. None or -1 uses every CPU.
+    :param int chunksize: Pairs per chunk. Defaults to four chunks per worker.
+    :return: pandas.Series, as returned by func.
+    """
+    n_jobs = effective_n_jobs(n_jobs)
+
+    index, values1, values2 = _pair_values(s1, s2)
+
+    if n_jobs == 1 or len(index) == 0:
+        return func(pd.Series(values1, index=index), pd.Series(values2, index=index), **kwargs)
+
+    if chunksize is None:
+        chunksize = -(-len(index) // (n_jobs * 4))
+
+    pool = get_process_pool(n_jobs)
+    futures = []
+    for start in range(0, len(index), chunksize):
+        stop = start + chunksize
+        futures.append(pool.submit(func,
+                                   pd.Series(values1[start:stop], index=index[start:stop]),
+                                   pd.Series(values2[start:stop], index=index[start:stop]),
+                                   **kwargs))
+
+    return pd.concat([future.result() for future in futures])
 
-    return conc.apply(except_apply, axis=1)
+
+# *****************************************************************************
+# Batch Comparison
+# *****************************************************************************
+class CompareBatch(object):
+    """
+    Computes several comparison features over the same candidate pairs in one go, like
+    recordlinkage's Compare. Each column is extracted once for all the comparators using
+    it, by position rather than by aligning on the pair index, and with n_jobs > 1 the
+    comparators run concurrently across a process pool (see labutils.get_process_pool).
+
+    Example:
+        .. code:: python
+
+            batch = CompareBatch(n_jobs=4)
+            batch.add(normed_fuzzy_lcss, 'name', 'name', label='name')
+            batch.add(compare_except, 'affiliation', 'affiliation', label='affiliation',
+                      exceptions=['University of'])
+            features = batch.compute(pairs, df_a, df_b)
+
+    Comparators run in worker processes must be picklable, e.g. module-level functions.
+    """
+
+    def __init__(self, n_jobs=1, chunksize=None):
+        """
+        :param int n_jobs: Number of worker processes. None or -1 uses every CPU.
+        :param int chunksize: Pairs per task. Defaults to four chunks per worker for each feature.
+        """
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.features = []
+
+    def add(self, func, left_on, right_on, label=None, **kwargs):
+        """
+        Adds a comparison feature. Extra keyword arguments are passed on to func.
+
+        :param function func: A comparison function taking two Series, e.g. normed_lcss.
+        :param left_on: The column of df_a to compare.
+        :param right_on: The column of df_b to compare.
+        :param label: The feature's column name. Defaults to its position.
+        :return: CompareBatch, for chaining.
+        """
+        label = len(self.features) if label is None else label
+        if label in [feature[3] for feature in self.features]:
+            raise ValueError('A feature labelled {!r} already exists.'.format(label))
+        self.features.append((func, left_on, right_on, label, kwargs))
+        return self
+
+    def compute(self, pairs, df_a, df_b=None):
+        """
+        Computes every feature for the candidate pairs.
+
+        :param pandas.MultiIndex pairs: Candidate record pairs, labelled by the indexes of df_a and df_b.
+        :param pandas.DataFrame df_a: The left data frame.
+        :param pandas.DataFrame df_b: The right data frame. Defaults to df_a (deduplication).
+        :return: pandas.DataFrame with one column per feature, indexed by pairs.
+        """
+        df_b = df_a if df_b is None else df_b
+        n_jobs = effective_n_jobs(self.n_jobs)
+
+        left_rows = pair_positions(df_a, pairs, 0)
+        right_rows = pair_positions(df_b, pairs, 1)
+        if len(pairs) == 0:
+            return pd.DataFrame(OrderedDict((feature[3], np.array([], dtype=float)) for feature in self.features),
+                                index=pairs, columns=[feature[3] for feature in self.features])
+
+        # Extract the values of each column once, in pair order.
+        columns = {}
+        for _, left_on, right_on, _, _ in self.features:
+            if ('left', left_on) not in columns:
+                columns[('left', left_on)] = df_a[left_on].to_numpy(dtype=object)[left_rows]
+            if ('right', right_on) not in columns:
+                columns[('right', right_on)] = df_b[right_on].to_numpy(dtype=object)[right_rows]
+
+        # Split each feature into tasks, run serially or across the pool.
+        if n_jobs == 1:
+            chunksize = len(pairs)
+        elif self.chunksize is None:
+            chunksize = -(-len(pairs) // (n_jobs * 4))
+        else:
+            chunksize = self.chunksize
+
+        tasks = []
+        for func, left_on, right_on, label, kwargs in self.features:
+            values1, values2 = columns[('left', left_on)], columns[('right', right_on)]
+            for start in range(0, len(pairs), chunksize):
+                stop = start + chunksize
+                tasks.append((label, func, pd.Series(values1[start:stop], index=pairs[start:stop]),
+                              pd.Series(values2[start:stop], index=pairs[start:stop]), kwargs))
+
+        if n_jobs == 1:
+            results = [func(s1, s2, **kwargs) for _, func, s1, s2, kwargs in tasks]
+        else:
+            pool = get_process_pool(n_jobs)
+            futures = [pool.submit(func, s1, s2, **kwargs) for _, func, s1, s2, kwargs in tasks]
+            results = [future.result() for future in futures]
+
+        # Stitch the chunks of each feature back together, in pair order.
+        scores = OrderedDict((feature[3], []) for feature in self.features)
+        for (label, _, _, _, _), result in zip(tasks, results):
+            scores[label].append(np.asarray(result))
+
+        return pd.DataFrame(OrderedDict((label, np.concatenate(chunks)) for label, chunks in scores.items()),
+                            index=pairs, columns=list(scores))
@@ -4,10 +4,116 @@
 # *****************************************************************************
 
 import copy
+import numpy as np
 import pandas as pd
-from labutils.misc import new_identifier_name
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components, min_weight_full_bipartite_matching
+from labutils.misc import new_identifier_names, effective_n_jobs, get_process_pool, pair_positions, ChunkWriter
 
-def rank_pairs(comp, by, method='cols', ascending=False, ):
+def _ranking_candidates(key, ascending, k, groups=None):
+    """
+    Finds the rows that can be among the best k by key, overall or within each group,
+    without sorting. Rows tied with the k-th best are all kept, so the result is a superset
+    that a sort of the (much smaller) candidate set cuts down to exactly k. NaN ranks last.
+
+    :param numpy.ndarray key: Float sort key of each row.
+    :param bool ascending: Whether small keys rank first.
+    :param int k: Number of rows to keep, overall or per group.
+    :param numpy.ndarray groups: Optional group code of each row.
+    :return: numpy.ndarray of candidate row positions, in their original order.
+    """
+    # Orient the key so that smaller is better, with NaN last.
+    oriented = np.where(np.isnan(key), np.inf, key if ascending else -key)
+
+    if groups is not None:
+        # Order rows by group, best first, and find the k-th best key of each group.
+        n = len(oriented)
+        rank = np.empty(n, dtype=np.int64)
+        rank[np.argsort(oriented)] = np.arange(n)
+        order = np.argsort((groups.astype(np.int64) + 1) * n + rank)
+        sorted_groups = groups[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        within = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        best = order[within < k]
+
+        # Codes may be -1 for missing labels, so shift them to index the thresholds.
+        thresholds = np.full(groups.max() + 2 if len(groups) else 1, -np.inf)
+        np.maximum.at(thresholds, groups[best] + 1, oriented[best])
+        return np.flatnonzero(oriented <= thresholds[groups + 1])
+
+    if k >= len(oriented):
+        return np.arange(len(oriented))
+    kth = np.partition(oriented, k - 1)[k - 1]
+    return np.flatnonzero(oriented <= kth)
+
+
+def _geometric_mean(values):
+    """
+    Row-wise geometric mean. Zeros give 0 and negative values give NaN.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.exp(np.log(values).mean(axis=1))
+
+
+# Aggregators map a (pairs x columns) float array to one ranking key per pair.
+_aggregators = {
+    'sum': lambda values: values @ np.ones(values.shape[1]),
+    'avg': lambda values: values @ np.ones(values.shape[1]) / values.shape[1],
+    'max': lambda values: values.max(axis=1),
+    'min': lambda values: values.min(axis=1),
+    'geomean': _geometric_mean,
+}
+
+
+def register_aggregator(name, func):
+    """
+    Registers a ranking aggregator, so that it can be used by name as the method of rank_pairs.
+
+    func receives a float array with one row per pair and one column per entry of "by", and
+    returns one ranking key per pair. NumPy ufuncs such as numpy.maximum are reduced along rows.
+
+    :param str name: The method name to register. Registering an existing name replaces it.
+    :param func: The aggregating function or ufunc.
+    :return: None
+    """
+    if name in ('cols', 'weighted'):
+        raise ValueError('Cannot replace the built-in "{}" ranking method.'.format(name))
+    if not callable(func):
+        raise ValueError('Aggregator must be callable.')
+    _aggregators[name] = func
+
+
+def _aggregate(values, method, weights=None):
+    """
+    Computes the ranking key of each pair with a built-in, registered or given aggregator.
+
+    :param numpy.ndarray values: Float array with one row per pair and one column per ranked column.
+    :param method: An aggregator name, 'weighted', or a callable.
+    :param weights: Column weights, for method='weighted'.
+    :return: numpy.ndarray
+    """
+    if method == 'weighted':
+        if weights is None:
+            raise ValueError('The "weighted" ranking method requires weights.')
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.shape != (values.shape[1],):
+            raise ValueError('Value of "weights" must have one weight per column in "by".')
+        return values @ weights
+
+    if callable(method):
+        func = method
+    elif method in _aggregators:
+        func = _aggregators[method]
+    else:
+        raise ValueError('Unrecognized ranking method.')
+
+    if isinstance(func, np.ufunc):
+        return func.reduce(values, axis=1)
+    return np.asarray(func(values), dtype=np.float64)
+
+
+def rank_pairs(comp, by, method='cols', ascending=False, inplace=False, top_k=None, per_left_k=None,
+               weights=None):
     """
     rank_pairs sorts pairs from a recordlinkage.Compare object, based on computed comparison values.
 
@@ -15,65 +121,248 @@ def rank_pairs(comp, by, method='cols', ascending=False, ):
         * 'cols': sort by first, column, ties broken by subsequent columns. See pandas.DataFrame.sort_values.
         * 'sum': sort by the sum of a list of columns.
         * 'avg': sort by the mean of a list of columns.
+        * 'max', 'min': sort by the largest or smallest of a list of columns.
+        * 'geomean': sort by the geometric mean of a list of columns.
+        * 'weighted': sort by the weighted sum of a list of columns, given "weights".
+        * any name added with register_aggregator, or a callable (see register_aggregator).
+
+    Nothing is deep-copied: the returned object shares df_a and df_b with comp, and only
+    vectors is reordered. With inplace=True, comp itself is reordered and returned. Aggregated
+    values are used as sort keys only; they are not added to vectors.
+
+    top_k and per_left_k keep only the best pairs overall, or for each left record. Candidates
+    are selected by partitioning on the (first) sort key, so only they are sorted.
 
     :param recordlinkage.Compare comp: A populated Comparison object.
     :param list by: A list of column name strings to sort on by "method".
     :param str method: A the method to sort by (see above).
     :param bool ascending: Specifies ordering of sorted rows.
+    :param bool inplace: Reorder comp.vectors instead of returning a new object.
+    :param int top_k: Keep only the best top_k pairs.
+    :param int per_left_k: Keep only the best per_left_k pairs of each left record.
+    :param list weights: Weights of the columns in "by", for method='weighted'.
     :return: recordlinkage.Compare
     """
 
-    # A fresh copy of the comparison object for modification.
-    working_comp = copy.deepcopy(comp)
-    
+    # Enforce input type.
+    if not isinstance(by, list):
+        raise ValueError('Value of "by" must be a list of column names.')
+    for name, k in (('top_k', top_k), ('per_left_k', per_left_k)):
+        if k is not None and (int(k) != k or k < 1):
+            raise ValueError('Value of "{}" must be a positive integer.'.format(name))
+
+    vectors = comp.vectors
+    positions = np.arange(len(vectors))
+
     # Sorting by columns is simple!
     if method == 'cols':
+        key = None
+        if top_k is not None or per_left_k is not None:
+            primary = vectors[by[0]].to_numpy(dtype=np.float64)
+            primary_ascending = ascending[0] if isinstance(ascending, list) else ascending
 
-        # Enforce input type.
-        if not isinstance(by, list):
-            raise ValueError('Value of "by" must be a list of column names.')
+    # Sort by an aggregate of the specified columns
+    else:
+        key = _aggregate(vectors[by].to_numpy(dtype=np.float64), method, weights)
+        primary, primary_ascending = key, ascending
+
+    # Narrow down to the pairs that can make the cut before sorting.
+    if per_left_k is not None:
+        left_codes = vectors.index.codes[0]
+        positions = _ranking_candidates(primary, primary_ascending, int(per_left_k), groups=left_codes)
+    elif top_k is not None:
+        positions = _ranking_candidates(primary, primary_ascending, int(top_k))
+
+    # Sort positions, without adding the key to vectors.
+    if key is None:
+        candidates = vectors[by].take(positions).reset_index(drop=True)
+        order = candidates.sort_values(by=by, ascending=ascending).index
+    else:
+        order = pd.Series(key[positions]).sort_values(ascending=ascending).index
+    positions = positions[order]
+
+    # Ties at the cut-off are broken by the sort.
+    if per_left_k is not None:
+        left_codes = left_codes[positions]
+        positions = positions[pd.Series(left_codes).groupby(left_codes, sort=False).cumcount().to_numpy() < per_left_k]
+    if top_k is not None:
+        positions = positions[:int(top_k)]
+
+    working_comp = comp if inplace is True else copy.copy(comp)
+    working_comp.vectors = vectors.take(positions)
+    return working_comp
 
-        working_comp.vectors = working_comp.vectors.sort_values(by=by, ascending=ascending)
-        return working_comp
 
-    # Sort by row sum for specified columns
-    if method == 'sum':
+def _greedy_one_to_one(left_codes, right_codes):
+    """
+    Finds the pairs kept by a greedy one-to-one pass: in order, a pair is kept if
+    neither of its indices belongs to a pair kept before it. A rejected pair does
+    not use up either of its indices.
 
-        # Enforce input type.
-        if not isinstance(by, list):
-            raise ValueError('Value of "by" must be a list of column names.')
+    :param numpy.ndarray left_codes: Integer codes (e.g. MultiIndex.codes) of left indices.
+    :param numpy.ndarray right_codes: Integer codes of right indices.
+    :return: numpy.ndarray of bools, True for kept pairs.
+    """
+    keep = np.zeros(len(left_codes), dtype=bool)
+    if len(keep) == 0:
+        return keep
 
-        # Find an unused column name
-        temp_col = new_identifier_name('sum', working_comp.vectors.columns)
+    # Flat byte flags indexed by code are much cheaper than sets of labels.
+    # The spare last flag is used by code -1 (a missing label).
+    seen_left = bytearray(int(left_codes.max()) + 2)
+    seen_right = bytearray(int(right_codes.max()) + 2)
 
-        # Make a temporary column, which is the sum of columns of interest.
-        working_comp.vectors[temp_col] = sum([working_comp.vectors[c] for c in by])
+    for i, (left, right) in enumerate(zip(left_codes.tolist(), right_codes.tolist())):
+        if not seen_left[left] and not seen_right[right]:
+            seen_left[left] = 1
+            seen_right[right] = 1
+            keep[i] = True
 
-        working_comp.vectors =  working_comp.vectors.sort_values(by=temp_col,ascending=ascending)
-        return working_comp
+    return keep
 
-    # Sort by row mean for specified columns
-    elif method == 'avg':
 
-        # Enforce input type.
-        if not isinstance(by, list):
-            raise ValueError('Value of "by" must be a list of column names.')
+def _unique_pairs(left_codes, right_codes, left_unique=True, right_unique=True):
+    """
+    Finds the pairs kept by the greedy refinement of refine_mapping, in order.
+
+    :param numpy.ndarray left_codes: Integer codes of left indices.
+    :param numpy.ndarray right_codes: Integer codes of right indices.
+    :param bool left_unique: Keep only the first pair of each left index.
+    :param bool right_unique: Keep only the first pair of each right index.
+    :return: numpy.ndarray of bools, True for kept pairs.
+    """
+    if left_unique is True and right_unique is True:
+        return _greedy_one_to_one(left_codes, right_codes)
+    elif left_unique is True:
+        return ~pd.Series(left_codes).duplicated().to_numpy()
+    elif right_unique is True:
+        return ~pd.Series(right_codes).duplicated().to_numpy()
+    return np.ones(len(left_codes), dtype=bool)
+
+
+def _max_weight_matching(left, right, weights):
+    """
+    Solves a maximum-weight bipartite matching, which need not match every node.
+
+    The problem is reduced to a minimum-cost perfect matching on a sparse graph:
+    every left node i gets a dummy partner i' on the right, every right node j a
+    dummy partner j' on the left, and every candidate pair (i, j) a dummy edge
+    (j', i') so both dummies can pair up when i and j are matched. All costs are
+    shifted to be positive; every perfect matching has the same number of edges,
+    so the shift doesn't change the solution.
+
+    :param numpy.ndarray left: Integer codes of left indices, one per candidate pair.
+    :param numpy.ndarray right: Integer codes of right indices. Pairs must be distinct.
+    :param numpy.ndarray weights: Finite score of each candidate pair.
+    :return: numpy.ndarray of bools, True for matched pairs.
+    """
+    left_nodes, left = np.unique(left, return_inverse=True)
+    right_nodes, right = np.unique(right, return_inverse=True)
+    n_left = len(left_nodes)
+    n_right = len(right_nodes)
+    size = n_left + n_right
+
+    cost = weights.max() + 1
+    rows = np.concatenate([left, np.arange(n_left), n_left + np.arange(n_right), n_left + right])
+    cols = np.concatenate([right, n_right + np.arange(n_left), np.arange(n_right), n_right + left])
+    data = np.concatenate([cost - weights, np.full(size + len(weights), cost)])
+
+    matrix = csr_matrix((data, (rows, cols)), shape=(size, size))
+    row_ind, col_ind = min_weight_full_bipartite_matching(matrix)
+
+    # Keep real left nodes matched to real right nodes.
+    real = (row_ind < n_left) & (col_ind < n_right)
+    matched = row_ind[real].astype(np.int64) * n_right + col_ind[real]
+    return np.isin(left.astype(np.int64) * n_right + right, matched)
+
 
-        # Find an unused column name
-        temp_col = new_identifier_name('avg', working_comp.vectors.columns)
+def _match_subproblems(subproblems):
+    """
+    Runs _max_weight_matching on each (left, right, weights) subproblem in turn.
+    Used as a single task by worker processes.
 
-        # Make a temporary column, which is the sum of columns of interest.
-        working_comp.vectors[temp_col] = sum([working_comp.vectors[c] for c in by])/len(by)
+    :param list subproblems: Argument tuples for _max_weight_matching.
+    :return: A list of bool arrays.
+    """
+    return [_max_weight_matching(*args) for args in subproblems]
 
-        working_comp.vectors = working_comp.vectors.sort_values(by=temp_col,ascending=ascending)
-        return working_comp
 
+def _optimal_one_to_one(left_codes, right_codes, weights, n_jobs=1, subproblem_size=1000):
+    """
+    Finds the one-to-one set of pairs with the highest total weight.
+
+    Candidate pairs are split into connected components of the bipartite graph
+    of left and right indices, since components share no indices and can be
+    solved independently. Components where one side has a single index are
+    solved directly by keeping their best pair. The rest are solved a few at a
+    time, grouped into subproblems of about subproblem_size pairs (the solver
+    slows down on large problems even when they are disconnected), and spread
+    across worker processes if n_jobs allows.
+
+    :param numpy.ndarray left_codes: Integer codes (e.g. MultiIndex.codes) of left indices.
+    :param numpy.ndarray right_codes: Integer codes of right indices.
+    :param numpy.ndarray weights: Score of each pair. Only pairs with positive scores can be kept.
+    :param int n_jobs: Number of worker processes (see labutils.effective_n_jobs).
+    :param int subproblem_size: Pairs per subproblem.
+    :return: numpy.ndarray of bools, True for kept pairs.
+    """
+    keep = np.zeros(len(weights), dtype=bool)
+
+    # Only the best row of a repeated pair can be kept, and pairs that don't add
+    # to the total are never worth keeping.
+    candidates = np.flatnonzero(weights > 0)
+    candidates = candidates[np.argsort(-weights[candidates], kind='stable')]
+    left = left_codes[candidates].astype(np.int64) + 1
+    right = right_codes[candidates].astype(np.int64) + 1
+    edges = candidates[~pd.Series(left * (right.max(initial=0) + 1) + right).duplicated().to_numpy()]
+    if len(edges) == 0:
+        return keep
+
+    # Label each pair with its connected component.
+    left_nodes, left = np.unique(left_codes[edges], return_inverse=True)
+    right_nodes, right = np.unique(right_codes[edges], return_inverse=True)
+    n_left = len(left_nodes)
+    n_nodes = n_left + len(right_nodes)
+    graph = coo_matrix((np.ones(len(edges)), (left, n_left + right)), shape=(n_nodes, n_nodes))
+    n_components, labels = connected_components(graph, directed=False)
+    components = labels[left]
+
+    # Pairs are in order of decreasing weight, so the best pair of a component comes first.
+    smaller_side = np.minimum(np.bincount(labels[:n_left], minlength=n_components),
+                              np.bincount(labels[n_left:], minlength=n_components))
+    star = smaller_side[components] == 1
+    first = ~pd.Series(components).duplicated().to_numpy()
+    keep[edges[star & first]] = True
+
+    # Group the remaining components into subproblems, without splitting any component.
+    rest = np.flatnonzero(~star)
+    if len(rest) == 0:
+        return keep
+    rest = rest[np.argsort(components[rest], kind='stable')]
+    starts = np.flatnonzero(np.diff(components[rest], prepend=-1))
+    subproblem = np.repeat(starts // subproblem_size, np.diff(np.append(starts, len(rest))))
+    bounds = np.append(np.flatnonzero(np.diff(subproblem, prepend=-1)), len(rest))
+    members = [rest[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+    subproblems = [(left[m], right[m], weights[edges[m]]) for m in members]
+
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs == 1:
+        results = _match_subproblems(subproblems)
     else:
-        raise ValueError('Unrecognized ranking method.')
-        return None
+        pool = get_process_pool(n_jobs)
+        n_tasks = min(len(subproblems), n_jobs * 4)
+        futures = [pool.submit(_match_subproblems, subproblems[t::n_tasks]) for t in range(n_tasks)]
+        results = [None] * len(subproblems)
+        for t, future in enumerate(futures):
+            results[t::n_tasks] = future.result()
+
+    for m, matched in zip(members, results):
+        keep[edges[m[matched]]] = True
 
+    return keep
 
-def refine_mapping(comp, left_unique=True, right_unique=True):
+
+def refine_mapping(comp, left_unique=True, right_unique=True, method='greedy', score=None, n_jobs=1):
     """
     Removes pairs that violate uniqueness rules. Matches may be one-to-one (default),
     one-to-many (right_unique=False), or many-to-one (left_unique=False). refine_mapping
@@ -81,56 +370,124 @@ def refine_mapping(comp, left_unique=True, right_unique=True):
     filter) pairs before passing to refine_mapping, e.g. with rank_pairs (or a classification
     algorithm).
 
+    In one-to-one mode a pair is kept if neither of its indices was used by an earlier
+    kept pair; pairs that were discarded don't use up their indices.
+
+    Available methods:
+        * 'greedy': keep-first resolution, as described above (default).
+        * 'optimal': one-to-one only. Keeps the set of pairs with the highest total "score",
+          regardless of order, by solving a maximum-weight bipartite matching on each
+          connected component of the candidate graph. Pairs without a positive score are never kept.
+
+    The returned object shares df_a and df_b with comp; only vectors is new.
+
     :param recordlinkage.Compare comp: A populated Comparison object.
     :param bool left_unique: Specifies uniqueness of left (top-level) indices.
     :param bool right_unique: Specifies uniqueness of right (top-level) indices.
+    :param str method: 'greedy' or 'optimal' (see above).
+    :param str score: The column of comp.vectors to maximize with method='optimal'.
+    :param int n_jobs: Number of worker processes used by method='optimal'.
     :return: recordlinkage.Compare
     """
 
-    # Copy comparison object indices.
-    working_indices = comp.vectors.index.to_frame()
+    if method == 'optimal':
 
-    # Save indices as pandas.Series.
-    working_left_index = list(working_indices[0])
-    working_right_index = list(working_indices[1])
+        # Enforce input type.
+        if not (left_unique is True and right_unique is True):
+            raise ValueError('The "optimal" method only supports one-to-one matching.')
+        if score not in comp.vectors.columns:
+            raise ValueError('Value of "score" must be a column name.')
 
-    # Track observed indices.
-    seen_left = set()
-    seen_right = set()
+    elif method != 'greedy':
+        raise ValueError('Unrecognized refinement method.')
+
+    # The MultiIndex already holds integer codes for each level.
+    left_codes, right_codes = comp.vectors.index.codes[:2]
 
     # Identify records to be kept/discarded.
+    if method == 'optimal':
+        weights = comp.vectors[score].to_numpy(dtype=np.float64)
+        keep_vector = _optimal_one_to_one(left_codes, right_codes, weights, n_jobs)
+    else:
+        keep_vector = _unique_pairs(left_codes, right_codes, left_unique, right_unique)
 
-    # 1 = Keep / 0 = Discard
-    keep_vector = []
+    # Return a new comparison object
+    working_comp = copy.copy(comp)
+    working_comp.vectors = comp.vectors.iloc[keep_vector]
+    return working_comp
 
-    # Iterate on indices
-    for i in range(0,len(working_indices)):
 
-        keep = True
+def _fuse_lookup(df, index, level, columns=None):
+    """
+    Finds the positions of the rows of df matching one level of the pair index, and of the
+    columns to keep, so that the fused data can be taken positionally.
+
+    :param pandas.DataFrame df: The data frame to take from.
+    :param pandas.MultiIndex index: The pair index.
+    :param int level: The level of index that labels rows of df.
+    :param list columns: Columns of df to keep. Defaults to all of them.
+    :return: A tuple of the row positions, one per pair, and the column positions.
+    """
+    rows = pair_positions(df, index, level)
 
-        # Check/add left index
-        if left_unique is True:
-            if working_left_index[i] in seen_left:
-                keep = False
-            else:
-                seen_left.add(working_left_index[i])
+    if columns is None:
+        cols = np.arange(df.shape[1])
+    else:
+        cols = df.columns.get_indexer(columns)
+        if (cols == -1).any():
+            raise KeyError('Columns not found: {}'.format([c for c, i in zip(columns, cols) if i == -1]))
 
-        # Check/add right index
-        if right_unique is True:
-            if working_right_index[i] in seen_right:
-                keep = False
-            else:
-                seen_right.add(working_right_index[i])
+    return rows, cols
 
-        keep_vector.append(keep)
 
-    # Return a new comparison object
-    working_comp = copy.deepcopy(comp)
-    working_comp.vectors = working_comp.vectors.iloc[keep_vector]
-    return working_comp
+def _fused_column_names(vector_columns, left_columns, right_columns, left_suffix, right_suffix):
+    """
+    Renames the kept columns of df_a and df_b so that they do not clash with the comparison
+    vector columns or each other.
+
+    :return: A tuple of the new df_a and df_b column name lists.
+    """
+    names = new_identifier_names([c + left_suffix for c in left_columns] + [c + right_suffix for c in right_columns],
+                                 vector_columns)
+    return names[:len(left_columns)], names[len(left_columns):]
+
+
+def _fuse_setup(comp, left_suffix, right_suffix, left_columns, right_columns):
+    """
+    Computes the row and column positions and the column names shared by every fused chunk.
+
+    :return: A tuple of (rows, columns, names) tuples for df_a and df_b.
+    """
+    left_rows, left_cols = _fuse_lookup(comp.df_a, comp.vectors.index, 0, left_columns)
+    right_rows, right_cols = _fuse_lookup(comp.df_b, comp.vectors.index, 1, right_columns)
+    left_names, right_names = _fused_column_names(comp.vectors.columns, comp.df_a.columns[left_cols],
+                                                  comp.df_b.columns[right_cols], left_suffix, right_suffix)
+    return (left_rows, left_cols, left_names), (right_rows, right_cols, right_names)
+
+
+def _fuse_chunk(vectors, df_a, df_b, left, right):
+    """
+    Fuses a block of compared pairs with their rows from df_a and df_b.
+
+    :param pandas.DataFrame vectors: Comparison vectors, indexed by (df_a, df_b) label pairs.
+    :param pandas.DataFrame df_a: The left data frame.
+    :param pandas.DataFrame df_b: The right data frame.
+    :param tuple left: Row positions (one per pair), column positions and new column names for df_a.
+    :param tuple right: Row positions (one per pair), column positions and new column names for df_b.
+    :return: pandas.DataFrame
+    """
+    fused = [vectors]
+    for df, (rows, cols, names) in ((df_a, left), (df_b, right)):
+        # Take only the needed rows and columns, then index them by pair.
+        working = df.iloc[rows, cols]
+        working.index = vectors.index
+        working.columns = names
+        fused.append(working)
+
+    return pd.concat(fused, axis=1)
 
 
-def fast_fuse(comp, left_suffix='_l', right_suffix='_r'):
+def fast_fuse(comp, left_suffix='_l', right_suffix='_r', left_columns=None, right_columns=None):
     """
     Performs data fusion using a recordlinkage.Compare object.
     All data is kept from both original data frames, renaming columns to avoid conflits.
@@ -140,27 +497,162 @@ def fast_fuse(comp, left_suffix='_l', right_suffix='_r'):
     :param recordlinkage.Compare comp: Compared pairs to be fused.
     :param str left_suffix: The suffix stem to be used to resolve naming conflits for columns in df_a.
     :param str right_suffix: The suffix stem to be used to resolve naming conflits for columns in df_b.
+    :param list left_columns: Columns of df_a to keep. Defaults to all of them.
+    :param list right_columns: Columns of df_b to keep. Defaults to all of them.
     :return: pandas.DataFrame
     """
+    left, right = _fuse_setup(comp, left_suffix, right_suffix, left_columns, right_columns)
+    return _fuse_chunk(comp.vectors, comp.df_a, comp.df_b, left, right)
 
-    working_df = copy.deepcopy(comp.vectors)
-    index_df = working_df.index.to_frame()
 
-    # Get appropriate columns from df_a and df_b
-    working_left = comp.df_a.loc[list(index_df[0])]
-    working_right = comp.df_b.loc[list(index_df[1])]
+def fuse_chunks(comp, chunksize=100000, left_suffix='_l', right_suffix='_r', left_columns=None, right_columns=None):
+    """
+    Performs the data fusion of fast_fuse one block of pairs at a time, so that memory use is
+    bounded by chunksize rather than by the number of pairs. Concatenating the chunks gives
+    the result of fast_fuse.
+
+    :param recordlinkage.Compare comp: Compared pairs to be fused.
+    :param int chunksize: Number of pairs in each chunk.
+    :param str left_suffix: The suffix stem to be used to resolve naming conflits for columns in df_a.
+    :param str right_suffix: The suffix stem to be used to resolve naming conflits for columns in df_b.
+    :param list left_columns: Columns of df_a to keep. Defaults to all of them.
+    :param list right_columns: Columns of df_b to keep. Defaults to all of them.
+    :return: A generator of pandas.DataFrame
+    """
+    if chunksize < 1:
+        raise ValueError('Value of "chunksize" must be a positive integer.')
+
+    (left_rows, left_cols, left_names), (right_rows, right_cols, right_names) = _fuse_setup(
+        comp, left_suffix, right_suffix, left_columns, right_columns)
 
-    # Index data from left and right dataframes
-    working_left = working_left.set_index(working_df.index)
-    working_right = working_right.set_index(working_df.index)
+    # An empty comparison still yields one (empty) chunk, so that the columns are known.
+    for start in range(0, max(len(comp.vectors), 1), int(chunksize)):
+        block = slice(start, start + int(chunksize))
+        yield _fuse_chunk(comp.vectors.iloc[block], comp.df_a, comp.df_b,
+                          (left_rows[block], left_cols, left_names), (right_rows[block], right_cols, right_names))
 
-    # Get new column names
-    left_col_names = [new_identifier_name(c + left_suffix, working_df.columns.tolist()) for c in working_left.columns]
-    right_col_names = [new_identifier_name(c + right_suffix, working_df.columns.tolist() + left_col_names) for c in working_right.columns]
 
-    # Apply columnn names
-    working_left.columns = left_col_names
-    working_right.columns = right_col_names
+def fuse_to_file(comp, path, chunksize=100000, format=None, left_suffix='_l', right_suffix='_r', left_columns=None,
+                 right_columns=None, schema=None):
+    """
+    Writes the data fusion of fast_fuse to a Parquet or CSV file, one block of pairs at a
+    time, without holding the fused data frame in memory. Parquet output requires pyarrow.
+
+    :param recordlinkage.Compare comp: Compared pairs to be fused.
+    :param str path: The file to write. An existing file is replaced.
+    :param int chunksize: Number of pairs in each chunk.
+    :param str format: 'parquet' or 'csv'. Defaults to 'parquet' for .parquet and .pq files, else 'csv'.
+    :param str left_suffix: The suffix stem to be used to resolve naming conflits for columns in df_a.
+    :param str right_suffix: The suffix stem to be used to resolve naming conflits for columns in df_b.
+    :param list left_columns: Columns of df_a to keep. Defaults to all of them.
+    :param list right_columns: Columns of df_b to keep. Defaults to all of them.
+    :param pyarrow.Schema schema: Optional Parquet schema for every chunk (see ChunkWriter).
+    :return: The number of fused rows written.
+    """
+    with ChunkWriter(path, format, schema) as writer:
+        for chunk in fuse_chunks(comp, chunksize, left_suffix, right_suffix, left_columns, right_columns):
+            writer.write(chunk)
+
+    return writer.rows
+
+
+def link_chunks(pairs, df_a, df_b, compare, by=None, method='sum', weights=None, threshold=None, left_unique=True,
+                right_unique=True, chunksize=1000000, left_suffix='_l', right_suffix='_r', left_columns=None,
+                right_columns=None):
+    """
+    A streaming record linkage pipeline. Candidate pairs move through comparison, scoring,
+    thresholding, uniqueness refinement and data fusion one chunk at a time, so memory use is
+    bounded by chunksize (plus df_a and df_b) rather than by the number of candidate pairs.
+
+    In each chunk, pairs are scored by aggregating the comparison features (see rank_pairs),
+    pairs scoring below threshold are dropped, and the rest are refined greedily from the best
+    score down (see refine_mapping). Records matched in earlier chunks stay matched: their
+    later pairs are dropped. The refinement is therefore greedy in chunk order; to match
+    records on their globally best pairs, send all candidate pairs of a record in one chunk
+    (e.g. one blocking key per chunk).
+
+    :param pairs: Candidate record pairs: a pandas.MultiIndex, split into chunks of chunksize, or an iterable of them (e.g. from blocking).
+    :param pandas.DataFrame df_a: The left data frame.
+    :param pandas.DataFrame df_b: The right data frame.
+    :param compare: A CompareBatch, or any object whose compute(pairs, df_a, df_b) returns comparison features (e.g. recordlinkage.Compare).
+    :param list by: The feature columns to score on. Defaults to all of them.
+    :param method: An aggregator for the score (see rank_pairs), other than 'cols'.
+    :param list weights: Weights of the columns in "by", for method='weighted'.
+    :param float threshold: Drop pairs scoring below this value.
+    :param bool left_unique: Specifies uniqueness of left (top-level) indices.
+    :param bool right_unique: Specifies uniqueness of right (top-level) indices.
+    :param int chunksize: Number of pairs in each chunk, when pairs is a MultiIndex.
+    :param str left_suffix: The suffix stem to be used to resolve naming conflits for columns in df_a.
+    :param str right_suffix: The suffix stem to be used to resolve naming conflits for columns in df_b.
+    :param list left_columns: Columns of df_a to keep. Defaults to all of them.
+    :param list right_columns: Columns of df_b to keep. Defaults to all of them.
+    :return: A generator of pandas.DataFrame, one per chunk, sorted by score.
+    """
+    if isinstance(pairs, pd.MultiIndex):
+        if chunksize < 1:
+            raise ValueError('Value of "chunksize" must be a positive integer.')
+        chunksize = int(chunksize)
+        chunks = (pairs[start:start + chunksize].remove_unused_levels()
+                  for start in range(0, max(len(pairs), 1), chunksize))
+    else:
+        chunks = pairs
+
+    # Records matched so far, by position in df_a and df_b.
+    seen_left = np.zeros(len(df_a), dtype=bool)
+    seen_right = np.zeros(len(df_b), dtype=bool)
+    names = None
+
+    for chunk in chunks:
+        vectors = compare.compute(chunk, df_a, df_b)
+
+        # Score, threshold and sort the pairs, best first.
+        key = _aggregate(vectors[list(vectors.columns) if by is None else by].to_numpy(dtype=np.float64),
+                         method, weights)
+        order = pd.Series(key).sort_values(ascending=False, kind='stable').index.to_numpy()
+        if threshold is not None:
+            order = order[key[order] >= threshold]
+        vectors = vectors.take(order)
+
+        left_rows, left_cols = _fuse_lookup(df_a, vectors.index, 0, left_columns)
+        right_rows, right_cols = _fuse_lookup(df_b, vectors.index, 1, right_columns)
+
+        # Drop pairs of records matched in earlier chunks, then refine within the chunk.
+        fresh = np.ones(len(vectors), dtype=bool)
+        if left_unique is True:
+            fresh &= ~seen_left[left_rows]
+        if right_unique is True:
+            fresh &= ~seen_right[right_rows]
+        kept = np.flatnonzero(fresh)
+        kept = kept[_unique_pairs(left_rows[kept], right_rows[kept], left_unique, right_unique)]
+        seen_left[left_rows[kept]] = True
+        seen_right[right_rows[kept]] = True
+
+        if names is None:
+            names = _fused_column_names(vectors.columns, df_a.columns[left_cols], df_b.columns[right_cols],
+                                        left_suffix, right_suffix)
+
+        yield _fuse_chunk(vectors.iloc[kept], df_a, df_b, (left_rows[kept], left_cols, names[0]),
+                          (right_rows[kept], right_cols, names[1]))
+
+
+def link_to_file(pairs, df_a, df_b, compare, path, format=None, schema=None, **kwargs):
+    """
+    Runs the streaming record linkage pipeline of link_chunks, appending each chunk of linked
+    and fused pairs to a Parquet or CSV file as soon as it is ready. Parquet output requires
+    pyarrow.
+
+    :param pairs: Candidate record pairs (see link_chunks).
+    :param pandas.DataFrame df_a: The left data frame.
+    :param pandas.DataFrame df_b: The right data frame.
+    :param compare: A CompareBatch (see link_chunks).
+    :param str path: The file to write. An existing file is replaced.
+    :param str format: 'parquet' or 'csv'. Defaults to 'parquet' for .parquet and .pq files, else 'csv'.
+    :param pyarrow.Schema schema: Optional Parquet schema for every chunk (see ChunkWriter).
+    :param kwargs: Other arguments of link_chunks, e.g. threshold or chunksize.
+    :return: The number of linked rows written.
+    """
+    with ChunkWriter(path, format, schema) as writer:
+        for chunk in link_chunks(pairs, df_a, df_b, compare, **kwargs):
+            writer.write(chunk)
 
-    return pd.concat([working_df, working_left, working_right],axis=1)
-    #return [working_df, working_left, working_right]
+    return writer.rows
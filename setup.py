@@ -104,10 +104,9 @@ setup(
     # dependencies). You can install these using the following syntax,
     # for example:
     # $ pip install -e .[dev,test]
-    # extras_require={
-    #     'dev': ['check-manifest'],
-    #     'test': ['coverage'],
-    # },
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
 
     # If there are test_data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
@@ -125,9 +124,9 @@ setup(
     # To provide executable scripts, use entry points in preference to the
     # "scripts" keyword. Entry points provide cross-platform support and allow
     # pip to create the appropriate form of executable for the target platform.
-    # entry_points={
-    #     'console_scripts': [
-    #         'sample=sample:main',
-    #     ],
-    # },
+    entry_points={
+        'console_scripts': [
+            'labutils-bench=labutils.benchmarks.run:main',
+        ],
+    },
 )